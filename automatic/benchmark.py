@@ -0,0 +1,205 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import corepath
+from board import Board
+from core import bitboard
+from bot import Bot
+
+DIRECTIONS_MAP = bitboard.DIRECTIONS_MAP
+
+CORPUS_SEED = 2048
+CORPUS_SIZE = 200
+
+# Fraction by which a benchmark may get slower than the baseline before it
+# is reported as a regression
+DEFAULT_THRESHOLD = 0.10
+
+# Builds the fixed corpus of packed boards: positions sampled from seeded
+# random games, covering early, mid and late game fill levels
+def build_corpus(size=CORPUS_SIZE, seed=CORPUS_SEED):
+    rng = random.Random(seed)
+    corpus = []
+
+    while len(corpus) < size:
+        board = bitboard.add_random_tile(bitboard.add_random_tile(0, rng), rng)
+
+        while not bitboard.is_game_over(board) and len(corpus) < size:
+            moved = bitboard.move(board, rng.randrange(4))
+            if moved == board: continue
+
+            board = bitboard.add_random_tile(moved, rng)
+            if rng.random() < 0.1: corpus.append(board)
+
+    return corpus
+
+# Runs fn(item) for every item, repeat times, and returns the best time
+def _time(fn, items, repeat):
+    best = float("inf")
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items: fn(item)
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+def bench_board_move(corpus, repeat):
+    boards = [(Board.from_packed(packed), DIRECTIONS_MAP[dir]) for packed in corpus for dir in range(4)]
+    return len(boards), _time(lambda item: item[0].move(item[1], apply_change=False), boards, repeat)
+
+def bench_board_is_game_over(corpus, repeat):
+    boards = [Board.from_packed(packed) for packed in corpus]
+    return len(boards), _time(lambda board: board.is_game_over(), boards, repeat)
+
+def bench_bot_heuristics(corpus, repeat):
+    bot = Bot()
+    return len(corpus), _time(bot._heuristics, corpus, repeat)
+
+# Full move decisions with a fresh bot, so the transposition table does not
+# carry results over between repetitions
+def bench_bot_search(depth, count):
+    def bench(corpus, repeat):
+        boards = [Board.from_packed(packed) for packed in corpus[:count] if not bitboard.is_game_over(packed)]
+        best = float("inf")
+
+        for _ in range(repeat):
+            bot = Bot()
+            start = time.perf_counter()
+            for board in boards: bot.get_best_action(board, depth)
+            best = min(best, time.perf_counter() - start)
+
+        return len(boards), best
+
+    return bench
+
+def bench_env_step(corpus, repeat):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "experiments"))
+    from gymcustomenv import Env2048
+
+    steps = 2000
+    actions = [random.Random(CORPUS_SEED + i).randrange(4) for i in range(steps)]
+    best = float("inf")
+
+    # Env2048 prints the highest tile of every finished game
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            env = Env2048()
+            env.reset(seed=CORPUS_SEED)
+            start = time.perf_counter()
+
+            for action in actions:
+                _, _, done, _, _ = env.step(action)
+                if done: env.reset()
+
+            best = min(best, time.perf_counter() - start)
+
+    return steps, best
+
+BENCHMARKS = {
+    "board_move": bench_board_move,
+    "board_is_game_over": bench_board_is_game_over,
+    "bot_heuristics": bench_bot_heuristics,
+    "bot_search_depth_0": bench_bot_search(0, 100),
+    "bot_search_depth_1": bench_bot_search(1, 20),
+    "bot_search_depth_2": bench_bot_search(2, 3),
+    "env_step": bench_env_step,
+}
+
+# Runs the selected benchmarks, a benchmark whose dependencies are missing
+# is reported as skipped
+def run(names, repeat):
+    corpus = build_corpus()
+    results = {}
+
+    for name in names:
+        try:
+            ops, seconds = BENCHMARKS[name](corpus, repeat)
+        except ImportError as e:
+            results[name] = {"skipped": str(e)}
+            print(f"{name:<24} skipped ({e})")
+            continue
+
+        results[name] = {
+            "ops": ops,
+            "seconds": seconds,
+            "ops_per_s": ops / seconds if seconds else 0.0,
+            "us_per_op": seconds / ops * 1e6 if ops else 0.0,
+        }
+        print(f"{name:<24} {results[name]['us_per_op']:>12.2f} us/op {results[name]['ops_per_s']:>14.1f} ops/s")
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": repeat,
+            "corpus_seed": CORPUS_SEED,
+            "corpus_size": len(corpus),
+        },
+        "results": results,
+    }
+
+# Compares against a saved baseline, returns the names of the benchmarks
+# that got slower by more than the threshold
+def compare(report, baseline, threshold=DEFAULT_THRESHOLD):
+    regressions = []
+    print(f"\n{'benchmark':<24} {'baseline':>12} {'current':>12} {'change':>9}")
+
+    for name, result in report["results"].items():
+        base = baseline["results"].get(name)
+        if base is None or "us_per_op" not in base or "us_per_op" not in result: continue
+
+        change = result["us_per_op"] / base["us_per_op"] - 1 if base["us_per_op"] else 0.0
+        flag = ""
+
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+
+        print(f"{name:<24} {base['us_per_op']:>12.2f} {result['us_per_op']:>12.2f} {change:>+8.1%}{flag}")
+
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the board engine, the bot search and the environment step")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run, all by default: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions of every benchmark, the best one is kept")
+    parser.add_argument("--output", default=None, help="write the results as JSON to this file")
+    parser.add_argument("--baseline", default=None, help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="slowdown flagged as a regression, 0.1 = 10%%")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        print(f"Unknown benchmarks: {', '.join(unknown)}")
+        return 2
+
+    report = run(args.names or list(BENCHMARKS), args.repeat)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions: {', '.join(regressions)}")
+            return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,75 +1,391 @@
-import copy
+import os
+import time
+import random
+import multiprocessing.util
 import globals
-from board import Board
+import corepath
+from core import bitboard
+from cache import TranspositionTable, LRU
+from heuristics import get_evaluator
+from diskcache import DiskCache, DEFAULT_SLOTS
+from searchstats import SearchStats
+from profiling import Profiler
 
-HEURISTIC = [[2**16,2**15,2**14,2**13],
-              [2**9, 2**10,2**11,2**12],
-              [2**8, 2**7, 2**6, 2**5],
-              [2,   2**2, 2**3, 2**4]]
+DIRECTIONS_MAP = bitboard.DIRECTIONS_MAP
 
-DIRECTIONS_MAP = {
-    0: "up",
-    1: "down",
-    2: "left",
-    3: "right",
-}
+# Deepest iteration tried by the time-budgeted search
+MAX_ITERATIVE_DEPTH = 8
+
+# Raised inside the search when the time budget of the move runs out
+class SearchTimeout(Exception):
+    pass
+
+# Raised out of get_best_action when the search is cancelled with
+# Bot.cancel() from another thread
+class SearchCancelled(Exception):
+    pass
+
+# How often a search waiting on the pool checks for cancellation, in seconds
+CANCEL_POLL_S = 0.05
+
+# Ways of splitting the search of a move over the pool workers:
+# ROOT sends one task per direction, CHANCE one task per
+# (direction, spawn cell, tile value) of the first chance layer
+ROOT = "root"
+CHANCE = "chance"
+
+# Bot used by the pool workers, rebuilt only when the configuration changes,
+# so its transposition table is kept across moves
+_worker_bot = None
+
+# Profiler of the search tasks of the worker, in profile mode
+_worker_profiler = None
+
+# Niceness added to the pool workers. With more busy workers than cores the
+# process waiting on them would otherwise get the CPU back well after the
+# time budget of its move runs out.
+WORKER_NICENESS = 10
+
+# Pool initializer: lowers the priority of the worker
+def init_worker():
+    if hasattr(os, "nice"): os.nice(WORKER_NICENESS)
+
+# Pool initializer of the profile mode (see profiling.py): the search tasks
+# of the worker are profiled, and the profile is saved in directory when the
+# worker exits after pool.close()
+def init_profiled_worker(directory):
+    global _worker_profiler
+    init_worker()
+    _worker_profiler = Profiler("worker")
+    multiprocessing.util.Finalize(None, _worker_profiler.save, args=(directory,), exitpriority=10)
+
+# Runs a search task in a pool worker. A task is a tuple of plain values:
+# (bot configuration, packed board, depth, probability, deadline, stats).
+# With stats the task returns (score, SearchStats of the task).
+def _search_task(task):
+    if _worker_profiler is None: return _run_search_task(task)
+
+    with _worker_profiler:
+        return _run_search_task(task)
+
+def _run_search_task(task):
+    global _worker_bot
+    config, board, depth, prob, deadline, stats = task
+
+    if _worker_bot is None or _worker_bot.config() != config:
+        _worker_bot = Bot(*config)
+
+    if not stats:
+        return _worker_bot._compute_goodness(board, depth, deadline=deadline, prob=prob)["score"]
+
+    _worker_bot.stats = SearchStats()
+    start = time.perf_counter()
+
+    try:
+        score = _worker_bot._compute_goodness(board, depth, deadline=deadline, prob=prob)["score"]
+    finally:
+        stats = _worker_bot.stats
+        stats.process_time[os.getpid()] += time.perf_counter() - start
+        _worker_bot.stats = None
+
+    return score, stats
 
 class Bot:
-    def __init__(self):
-        pass
+    # cache_size: maximum number of positions kept in the transposition table,
+    #   0 disables caching
+    # cache_policy: "lru" or "depth" (see cache.py)
+    # prob_cutoff: chance branches whose cumulative probability falls below
+    #   this threshold are not expanded and get the heuristic score instead,
+    #   0 disables the pruning
+    # sample_cells: if set and a chance node has more empty cells than this,
+    #   only this many randomly chosen cells are expanded
+    # seed: seed of the generator used to sample the cells
+    # parallel: how the search is split when a pool is given, ROOT or CHANCE
+    # evaluator: name of the leaf evaluation function (see heuristics.py)
+    # disk_cache: path of a persistent evaluation cache file shared across
+    #   runs and pool workers (see diskcache.py), None to disable it
+    # disk_cache_slots: number of entries when the file has to be created
+    # stats: record a SearchStats for every move in self.last_stats (see
+    #   searchstats.py), the counters cost nothing when disabled
+    def __init__(self, cache_size=100000, cache_policy=LRU, prob_cutoff=0.0, sample_cells=None, seed=None, parallel=CHANCE, evaluator="snake", disk_cache=None, disk_cache_slots=DEFAULT_SLOTS, stats=False):
+        if parallel not in (ROOT, CHANCE):
+            raise ValueError(f"Unknown parallel mode: {parallel}")
+
+        self.cache_size = cache_size
+        self.cache_policy = cache_policy
+        self.prob_cutoff = prob_cutoff
+        self.sample_cells = sample_cells
+        self.seed = seed
+        self.parallel = parallel
+        self.evaluator_name = evaluator
+        self.evaluator = get_evaluator(evaluator)
+        # With an evaluator that scores all 8 orientations of a board the
+        # same, the search value is symmetric too, so the transposition table
+        # is keyed on the canonical orientation and shares one entry between
+        # the symmetric copies of a position
+        self.canonical_keys = self.evaluator.symmetric
+
+        self.disk_cache_path = disk_cache
+        self.disk_cache_slots = disk_cache_slots
+        self.disk_cache = None
+
+        if disk_cache is not None:
+            namespace = f"evaluator={evaluator};prob_cutoff={prob_cutoff};sample_cells={sample_cells}"
+            self.disk_cache = DiskCache(disk_cache, disk_cache_slots, namespace)
+        self.rng = random.Random(seed)
+        self.cache = TranspositionTable(cache_size, cache_policy)
+        self.completed_depth = None
+        self.collect_stats = stats
+        # Record of the move being searched, None when stats are disabled
+        self.stats = None
+        self.last_stats = None
+        # Set by cancel() to abort the running search, the caller clears it
+        # before starting a new one
+        self.cancelled = False
+        self._deadline = None
+
+    # Arguments needed to rebuild an equivalent Bot in a pool worker
+    def config(self):
+        return (self.cache_size, self.cache_policy, self.prob_cutoff, self.sample_cells, self.seed, self.parallel, self.evaluator_name, self.disk_cache_path, self.disk_cache_slots)
+
+    # Aborts the search running in another thread, which raises
+    # SearchCancelled. Pool tasks already sent finish in the workers, but
+    # their results are not waited for.
+    def cancel(self):
+        self.cancelled = True
+
+    # Returns the index of the best direction for the given Board.
+    # The search runs on the packed representation, so only integers
+    # are sent to the pool workers.
+    #
+    # If time_budget_ms is given, depth is ignored and the search deepens
+    # iteratively (0, 1, 2, ... up to max_depth) until the budget runs out;
+    # the move of the deepest completed iteration is returned and its depth
+    # is stored in self.completed_depth.
+    def get_best_action(self, board, depth=1, pool=None, time_budget_ms=None, max_depth=MAX_ITERATIVE_DEPTH):
+        if not self.collect_stats:
+            return self._best_action(board, depth, pool, time_budget_ms, max_depth)
+
+        self.stats = stats = SearchStats()
+        stats.moves = 1
+        start = time.perf_counter()
+
+        try:
+            return self._best_action(board, depth, pool, time_budget_ms, max_depth)
+        finally:
+            stats.wall_time = time.perf_counter() - start
+            if time_budget_ms is not None and self.completed_depth is not None:
+                stats.completed_depths[self.completed_depth] += 1
+
+            self.stats = None
+            self.last_stats = stats
+
+    def _best_action(self, board, depth, pool, time_budget_ms, max_depth):
+        if time_budget_ms is None:
+            return self._search_root(board.packed, depth, pool)
+
+        deadline = time.monotonic() + time_budget_ms / 1000
+        best_action = None
+        self.completed_depth = None
+
+        for iteration_depth in range(max_depth + 1):
+            try:
+                best_action = self._search_root(board.packed, iteration_depth, pool, deadline)
+            except SearchTimeout:
+                break
+
+            if self.cancelled: raise SearchCancelled()
+
+            self.completed_depth = iteration_depth
+            if time.monotonic() >= deadline: break
+
+        # Not even the shallowest iteration completed, fall back to the
+        # heuristic of the moved boards
+        if self.completed_depth is None:
+            best_action = self._search_root(board.packed, -1, None)
+
+        return best_action
 
-    def get_best_action(self, board, depth, pool=None):
+    # Evaluates every move of the root board and returns the best direction
+    def _search_root(self, packed, depth, pool, deadline=None):
         best_score = float("-inf")
         best_action = None
 
-        goodnesses = []
+        legal = bitboard.legal_moves(packed)
+        children = [(dir, bitboard.move(packed, dir)) for dir in range(4) if legal >> dir & 1]
 
-        for dir in range(4):
-            direction = DIRECTIONS_MAP[dir]
-            action_board = Board(board.move(direction, apply_change=False))
-            if action_board.board == board.board: continue
-            goodnesses.append(pool.apply_async(self._compute_goodness, (action_board, depth, dir)))
-            #goodnesses.append(self._compute_goodness(action_board, depth, dir))
-        
-        goodnesses = [goodness.get() for goodness in goodnesses]
+        if pool is None:
+            scores = [self._compute_goodness(action_board, depth, dir, deadline)["score"] for dir, action_board in children]
+        elif self.parallel == CHANCE and depth == int(depth):
+            scores = self._parallel_chance_scores(children, depth, pool, deadline)
+        else:
+            scores = self._map(pool, [(self.config(), action_board, depth, 1.0, deadline, self.stats is not None) for _, action_board in children], deadline)
 
-        for goodness in goodnesses:
-            if goodness["score"] >= best_score:
-                best_score = goodness["score"]
-                best_action = goodness["action"]
+        for (dir, _), score in zip(children, scores):
+            if score >= best_score:
+                best_score = score
+                best_action = dir
 
         return best_action
 
+    # Scores the root children by sending every node of the first chance
+    # layer to the pool as a separate task. The weighted sums are accumulated
+    # in the same order as in _expectimax, so with pruning and sampling
+    # disabled the result is identical to the serial search.
+    def _parallel_chance_scores(self, children, depth, pool, deadline):
+        config = self.config()
+        stats = self.stats is not None
+        tasks = []
+        plans = []
+
+        for _, action_board in children:
+            if depth < 0 or bitboard.is_game_over(action_board):
+                plans.append(self._expectimax(action_board, depth))
+                continue
+
+            indices_list = bitboard.empty_indices(action_board)
+
+            if self.sample_cells and len(indices_list) > self.sample_cells:
+                indices_list = self.rng.sample(indices_list, self.sample_cells)
+
+            cell_prob = 1.0 / len(indices_list)
+            weights = []
+
+            for i in indices_list:
+                weights.extend((cell_prob * 0.9, cell_prob * 0.1))
+                tasks.append((config, action_board | (1 << (4 * i)), depth-0.5, cell_prob * 0.9, deadline, stats))
+                tasks.append((config, action_board | (2 << (4 * i)), depth-0.5, cell_prob * 0.1, deadline, stats))
+
+            plans.append(weights)
+
+            if self.stats is not None:
+                self.stats.chance_nodes[depth] += 1
+                self.stats.chance_children[depth] += len(weights)
+
+        values = iter(self._map(pool, tasks, deadline))
+        scores = []
+
+        for plan in plans:
+            if not isinstance(plan, list):
+                scores.append(plan)
+                continue
+
+            score = 0
+            for weight in plan: score += weight * next(values)
+            scores.append(score)
+
+        return scores
+
+    # Runs the tasks on the pool, waiting in short steps so that a
+    # cancellation does not have to wait for the whole batch. Once the
+    # deadline passes SearchTimeout is raised right away, the tasks still
+    # queued or running time out in the workers on their own.
+    def _map(self, pool, tasks, deadline=None):
+        result = pool.map_async(_search_task, tasks, chunksize=1)
+
+        while not result.ready():
+            timeout = CANCEL_POLL_S
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0: raise SearchTimeout()
+                timeout = min(timeout, remaining)
+
+            result.wait(timeout)
+            if self.cancelled: raise SearchCancelled()
+
+        if self.stats is None: return result.get()
+
+        scores = []
+        for score, stats in result.get():
+            self.stats.merge(stats)
+            scores.append(score)
+
+        return scores
+
+    # Scores a leaf board with the selected evaluator
     def _heuristics(self, board):
-        score = sum(board.board[i][j] * HEURISTIC[i][j] for i in range(4) for j in range(4))
-        return score
+        return self.evaluator(board)
+
+    # Raises SearchTimeout if the deadline (a time.monotonic() value,
+    # comparable across the pool processes) passes during the search
+    def _compute_goodness(self, board, depth, direction=None, deadline=None, prob=1.0):
+        self._deadline = deadline
+        try:
+            return {"score": self._expectimax(board, depth, prob), "action": direction}
+        finally:
+            self._deadline = None
+
+    # Expectimax over packed boards: half depths are max (direction) layers,
+    # whole depths are chance (tile spawn) layers. Results of inner nodes are
+    # memoized in the transposition table, keyed on the board and the depth.
+    # prob is the cumulative probability of reaching the node; with pruning
+    # enabled the cached values are approximations computed under whichever
+    # probability first reached the position.
+    def _expectimax(self, board, depth, prob=1.0):
+        legal = bitboard.legal_moves(board)
+        stats = self.stats
+
+        if stats is not None:
+            stats.game_over_checks += 1
+            if not legal: stats.game_overs += 1
+            elif depth < 0: stats.leaves += 1
+            elif prob < self.prob_cutoff:
+                stats.leaves += 1
+                stats.pruned += 1
+
+        if not legal: return float("-inf")
+        elif depth < 0 or prob < self.prob_cutoff: return self._heuristics(board)
+
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            raise SearchTimeout()
+        if self.cancelled: raise SearchCancelled()
 
-    def _compute_goodness(self, board, depth, direction=None):
-        if board.is_game_over(): return {"score": float("-inf"), "action": direction}
-        elif depth < 0: return {"score": self._heuristics(board), "action": direction}
+        key = bitboard.canonical_key(board) if self.canonical_keys else board
+        score = self.cache.get(key, depth)
 
-        score = 0
+        if score is None and self.disk_cache is not None:
+            score = self.disk_cache.get(key, depth)
+            if score is not None:
+                self.cache.put(key, depth, score)
+                if stats is not None: stats.disk_hits += 1
+
+        if score is not None:
+            if stats is not None: stats.cache_hits += 1
+            return score
 
         if depth != int(depth):
             score = float("-inf")
 
+            if stats is not None:
+                stats.max_nodes[depth] += 1
+                stats.max_children[depth] += bin(legal).count("1")
+
             for dir in range(4):
-                direction = DIRECTIONS_MAP[dir]
-                action_board = Board(board.move(direction, apply_change=False))
-                if action_board != board:
-                    goodness_score = self._compute_goodness(action_board, depth=depth-0.5, direction=direction)["score"]
+                if legal >> dir & 1:
+                    goodness_score = self._expectimax(bitboard.move(board, dir), depth-0.5, prob)
                     if goodness_score > score: score = goodness_score
-        
-        elif depth == int(depth):
+
+        else:
             score = 0
-            indices_list = [(i, j) for i, row in enumerate(board.board) for j, tile in enumerate(row) if tile == 0]
+            indices_list = bitboard.empty_indices(board)
+
+            if self.sample_cells and len(indices_list) > self.sample_cells:
+                indices_list = self.rng.sample(indices_list, self.sample_cells)
 
-            for r, c in indices_list:
-                board2, board4 = copy.deepcopy(board), copy.deepcopy(board)
-                board2.board[r][c], board4.board[r][c] = 2, 4
+            cell_prob = 1.0 / len(indices_list)
 
-                score += 1.0 / len(indices_list) * 0.9 * self._compute_goodness(board2, depth=depth-0.5, direction=direction)["score"]
-                score += 1.0 / len(indices_list) * 0.1 * self._compute_goodness(board4, depth=depth-0.5, direction=direction)["score"]
-        
-        return {"score": score, "action": direction}
+            if stats is not None:
+                stats.chance_nodes[depth] += 1
+                stats.chance_children[depth] += 2 * len(indices_list)
 
+            for i in indices_list:
+                board2, board4 = board | (1 << (4 * i)), board | (2 << (4 * i))
+
+                score += cell_prob * 0.9 * self._expectimax(board2, depth-0.5, prob * cell_prob * 0.9)
+                score += cell_prob * 0.1 * self._expectimax(board4, depth-0.5, prob * cell_prob * 0.1)
+
+        self.cache.put(key, depth, score)
+        if self.disk_cache is not None: self.disk_cache.put(key, depth, score)
+
+        return score
@@ -0,0 +1,93 @@
+from collections import OrderedDict
+
+# Replacement policies of the TranspositionTable
+LRU = "lru"
+DEPTH = "depth"
+
+# How many of the least recently used entries are inspected when looking
+# for the shallowest one to evict with the depth-preferred policy
+DEPTH_CANDIDATES = 8
+
+# Bounded cache of search results keyed on (packed board, remaining depth).
+#
+# With the "lru" policy the least recently used entry is evicted when the
+# table is full. With the "depth" policy the shallowest entry among the
+# DEPTH_CANDIDATES least recently used ones is evicted instead, since shallow
+# results are the cheapest to compute again.
+class TranspositionTable:
+    def __init__(self, max_size=100000, policy=LRU):
+        if policy not in (LRU, DEPTH):
+            raise ValueError(f"Unknown replacement policy: {policy}")
+
+        self.max_size = max_size
+        self.policy = policy
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Returns the cached value, or None if the position is not stored
+    def get(self, board, depth):
+        key = (board, depth)
+        value = self.entries.get(key)
+
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    # Stores a value, evicting an entry if the table is full
+    def put(self, board, depth, value):
+        if self.max_size <= 0: return
+
+        key = (board, depth)
+        if key in self.entries:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            return
+
+        if len(self.entries) >= self.max_size:
+            self._evict()
+
+        self.entries[key] = value
+
+    def clear(self):
+        self.entries.clear()
+
+    # Hit/miss/eviction counters, useful to size the table
+    def stats(self):
+        lookups = self.hits + self.misses
+
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _evict(self):
+        if self.policy == LRU:
+            self.entries.popitem(last=False)
+        else:
+            candidates = []
+            for key in self.entries:
+                candidates.append(key)
+                if len(candidates) == DEPTH_CANDIDATES: break
+
+            del self.entries[min(candidates, key=lambda key: key[1])]
+
+        self.evictions += 1
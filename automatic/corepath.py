@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Puts the repository root on sys.path, so that the scripts of this folder
+# can import the game rules shared by the front-ends in ../core. Every module
+# of the folder that imports core imports this module first.
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+if ROOT not in sys.path: sys.path.insert(0, ROOT)
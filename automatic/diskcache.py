@@ -0,0 +1,142 @@
+import hashlib
+import mmap
+import os
+import struct
+
+# Persistent evaluation cache: a fixed-size hash table in a memory-mapped
+# file, mapping (packed board, depth) to the search value of the position.
+#
+# File layout (little endian):
+#   header, 32 bytes: magic, version (u32), entry size (u32), number of
+#     slots (u64), namespace fingerprint (8 bytes)
+#   slots, 24 bytes each: check (u64), depth code (u64), value (f64 bits)
+#
+# The table is direct-mapped and a new entry always replaces the old one.
+# There are no locks: every entry stores check = board ^ depth code ^ value
+# bits, and a read only counts as a hit if the three words XOR back to the
+# board it looks for. A slot torn by two processes writing at the same time,
+# or by a crash in the middle of a write, fails the check and reads as a
+# miss. This makes the file safe to share between the pool workers and to
+# reuse across runs.
+#
+# The namespace (evaluator and search settings) is fingerprinted in the
+# header, values computed with different settings are never mixed.
+
+MAGIC = b"2048EVC1"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQ8s")
+ENTRY = struct.Struct("<QQQ")
+DOUBLE = struct.Struct("<d")
+U64 = struct.Struct("<Q")
+
+DEFAULT_SLOTS = 1 << 20
+
+M64 = (1 << 64) - 1
+
+# splitmix64 finalizer, spreads the board bits over the slot index
+def _mix(x):
+    x = (x + 0x9E3779B97F4A7C15) & M64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & M64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & M64
+    return x ^ (x >> 31)
+
+def _fingerprint(namespace):
+    return hashlib.blake2b(namespace.encode(), digest_size=8).digest()
+
+class DiskCache:
+    # path: cache file, created if missing
+    # slots: number of entries of a new file, an existing file keeps its size
+    # namespace: describes how the stored values were computed; opening a
+    #   file created with another namespace raises ValueError
+    def __init__(self, path, slots=DEFAULT_SLOTS, namespace=""):
+        self.path = path
+        self.namespace = namespace
+
+        if not os.path.exists(path):
+            self._create(path, slots, namespace)
+
+        self.file = open(path, "r+b")
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+
+        magic, version, entry_size, self.slots, fingerprint = HEADER.unpack_from(self.mm, 0)
+
+        if magic != MAGIC or version != VERSION or entry_size != ENTRY.size:
+            self.close()
+            raise ValueError(f"{path} is not an evaluation cache file")
+
+        if fingerprint != _fingerprint(namespace):
+            self.close()
+            raise ValueError(f"{path} was created for different search settings than {namespace!r}")
+
+        if len(self.mm) != HEADER.size + self.slots * ENTRY.size:
+            self.close()
+            raise ValueError(f"{path} is truncated")
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    # Writes the zeroed table to a temporary file and links it in place, so
+    # processes opening the cache concurrently never see a partial file
+    @staticmethod
+    def _create(path, slots, namespace):
+        tmp = f"{path}.{os.getpid()}.tmp"
+
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, ENTRY.size, slots, _fingerprint(namespace)))
+            f.truncate(HEADER.size + slots * ENTRY.size)
+
+        # link fails if another process created the file meanwhile, in that
+        # case its file is kept
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp)
+
+    # Depths are multiples of 0.5 from -0.5 up, code 0 marks an empty slot
+    @staticmethod
+    def _depth_code(depth):
+        return int(depth * 2) + 2
+
+    def _offset(self, board, code):
+        return HEADER.size + (_mix(board ^ (code << 60)) % self.slots) * ENTRY.size
+
+    # Returns the stored value, or None if the position is not stored
+    def get(self, board, depth):
+        code = self._depth_code(depth)
+        check, stored_code, bits = ENTRY.unpack_from(self.mm, self._offset(board, code))
+
+        if stored_code != code or check ^ stored_code ^ bits != board:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return DOUBLE.unpack(U64.pack(bits))[0]
+
+    def put(self, board, depth, value):
+        code = self._depth_code(depth)
+        bits = U64.unpack(DOUBLE.pack(value))[0]
+
+        ENTRY.pack_into(self.mm, self._offset(board, code), board ^ code ^ bits, code, bits)
+        self.writes += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+
+        return {
+            "slots": self.slots,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    # Pushes the written pages to the file
+    def flush(self):
+        self.mm.flush()
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
@@ -0,0 +1,203 @@
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+import time
+import multiprocessing as mp
+from collections import Counter
+
+from board import Board
+import profiling
+from bot import Bot, init_worker, init_profiled_worker
+from searchstats import SearchStats, print_stats
+
+DIRECTIONS_MAP = {
+    0: "up",
+    1: "down",
+    2: "left",
+    3: "right",
+}
+
+LATENCY_PERCENTILES = [50, 90, 99]
+
+# Plays a whole game without display and returns its result, the latency
+# of every move in seconds is included so reports can be aggregated.
+# The tile spawns are seeded with seed (a random one if None), the game log
+# is written to log_path if given and can be replayed with replay.py.
+# With a bot created with stats=True, the search stats of every move and
+# their sum over the game are included as well.
+def play_game(bot, depth=1, time_budget_ms=None, pool=None, max_moves=None, seed=None, log_path=None):
+    board = Board(seed=seed)
+    latencies = []
+    move_stats = []
+
+    while not board.is_game_over():
+        if max_moves is not None and len(latencies) >= max_moves: break
+
+        start = time.perf_counter()
+        action = bot.get_best_action(board, depth=depth, pool=pool, time_budget_ms=time_budget_ms)
+        latencies.append(time.perf_counter() - start)
+        if bot.last_stats is not None: move_stats.append(bot.last_stats)
+
+        board.move(DIRECTIONS_MAP[action])
+
+    if log_path is not None: board.log.save(log_path)
+
+    result = {
+        "board_seed": board.seed,
+        "score": board.score,
+        "max_tile": max(max(row) for row in board.board),
+        "moves": len(latencies),
+        "latencies": latencies,
+    }
+
+    if bot.collect_stats:
+        game_stats = SearchStats()
+        for stats in move_stats: game_stats.merge(stats)
+
+        result["move_stats"] = [stats.to_dict() for stats in move_stats]
+        result["search_stats"] = game_stats.to_dict()
+
+    return result
+
+# Nearest-rank percentile of an already sorted list
+def percentile(values, p):
+    if not values: return 0.0
+
+    index = max(0, min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1))
+    return values[index]
+
+# Aggregates the results of play_game into a throughput report
+def summarize(results, elapsed):
+    scores = sorted(result["score"] for result in results)
+    latencies = sorted(latency for result in results for latency in result["latencies"])
+    moves = sum(result["moves"] for result in results)
+
+    report = {
+        "games": len(results),
+        "moves": moves,
+        "elapsed_s": elapsed,
+        "games_per_s": len(results) / elapsed if elapsed else 0.0,
+        "moves_per_s": moves / elapsed if elapsed else 0.0,
+        "score": {
+            "min": scores[0] if scores else 0,
+            "mean": sum(scores) / len(scores) if scores else 0.0,
+            "median": percentile(scores, 50),
+            "max": scores[-1] if scores else 0,
+        },
+        "max_tile_histogram": {str(tile): count for tile, count in sorted(Counter(result["max_tile"] for result in results).items())},
+        "latency_ms": {
+            **{f"p{p}": percentile(latencies, p) * 1000 for p in LATENCY_PERCENTILES},
+            "max": latencies[-1] * 1000 if latencies else 0.0,
+        },
+    }
+
+    if any("search_stats" in result for result in results):
+        search_stats = SearchStats()
+        for result in results:
+            if "search_stats" in result: search_stats.merge(SearchStats.from_dict(result["search_stats"]))
+
+        report["search_stats"] = search_stats.to_dict()
+
+    return report
+
+def print_report(report):
+    print(f"Games: {report['games']}, moves: {report['moves']}, elapsed: {report['elapsed_s']:.2f}s")
+    print(f"Throughput: {report['games_per_s']:.3f} games/s, {report['moves_per_s']:.1f} moves/s")
+
+    score = report["score"]
+    print(f"Score: min {score['min']}, mean {score['mean']:.1f}, median {score['median']}, max {score['max']}")
+
+    print("Max tile histogram:")
+    for tile, count in report["max_tile_histogram"].items():
+        print(f"  {tile:>6}: {count}")
+
+    latency = report["latency_ms"]
+    print("Move latency (ms): " + ", ".join(f"{name} {value:.2f}" for name, value in latency.items()))
+
+    if "search_stats" in report: print_stats(SearchStats.from_dict(report["search_stats"]))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Plays 2048 games with the bot without display and reports the throughput")
+    parser.add_argument("--games", type=int, default=10, help="number of games to play")
+    parser.add_argument("--depth", type=float, default=1, help="search depth")
+    parser.add_argument("--time-budget-ms", type=float, default=None, help="per-move time budget, enables iterative deepening")
+    parser.add_argument("--max-moves", type=int, default=None, help="stop every game after this many moves")
+    parser.add_argument("--processes", type=int, default=0, help="size of the search pool, 0 searches in this process")
+    parser.add_argument("--seed", type=int, default=None, help="game i spawns its tiles with seed + i")
+    parser.add_argument("--cache-size", type=int, default=100000)
+    parser.add_argument("--prob-cutoff", type=float, default=0.0)
+    parser.add_argument("--sample-cells", type=int, default=None)
+    parser.add_argument("--evaluator", default="snake", help="leaf evaluation function, see heuristics.EVALUATORS")
+    parser.add_argument("--disk-cache", default=None, help="persistent evaluation cache file shared across runs and workers")
+    parser.add_argument("--stats", action="store_true", help="record and report search statistics (nodes per layer, cache hits, worker time)")
+    parser.add_argument("--log-dir", default=None, help="write the log of every game to this directory, see replay.py")
+    parser.add_argument("--profile", default=None, metavar="DIR", help="profile the search, pool workers included, and write the merged report and collapsed stacks to DIR")
+    parser.add_argument("--profile-moves", type=int, default=200, help="number of moves played in profile mode")
+    parser.add_argument("--json", default=None, help="also write the report to this file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.seed is not None: random.seed(args.seed)
+    if args.log_dir is not None: os.makedirs(args.log_dir, exist_ok=True)
+
+    bot = Bot(cache_size=args.cache_size, prob_cutoff=args.prob_cutoff, sample_cells=args.sample_cells, seed=args.seed, evaluator=args.evaluator, disk_cache=args.disk_cache, stats=args.stats)
+
+    # In profile mode the workers save their profiles when the pool is
+    # closed, the run stops after profile_moves moves in total
+    profiler = None
+    remaining = None
+
+    if args.profile is not None:
+        profiling.prepare(args.profile)
+        profiler = profiling.Profiler("main")
+        remaining = args.profile_moves
+
+    if args.processes <= 0:
+        pool = None
+    elif profiler is not None:
+        pool = mp.Pool(processes=args.processes, initializer=init_profiled_worker, initargs=(args.profile,))
+    else:
+        pool = mp.Pool(processes=args.processes, initializer=init_worker)
+
+    results = []
+    start = time.perf_counter()
+
+    try:
+        with profiler or contextlib.nullcontext():
+            for game in range(args.games):
+                if remaining == 0: break
+
+                seed = args.seed + game if args.seed is not None else None
+                log_path = os.path.join(args.log_dir, f"game-{game}.log") if args.log_dir is not None else None
+                max_moves = args.max_moves if remaining is None else min(remaining, args.max_moves or remaining)
+
+                result = play_game(bot, args.depth, args.time_budget_ms, pool, max_moves, seed, log_path)
+                results.append(result)
+                print(f"Game {game + 1}/{args.games}: score {result['score']}, max tile {result['max_tile']}, moves {result['moves']}")
+
+                if remaining is not None: remaining -= result["moves"]
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if profiler is not None:
+        profiler.save(args.profile)
+        print(f"Profile written to {profiling.merge(args.profile)}")
+
+    report = summarize(results, time.perf_counter() - start)
+    print_report(report)
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    mp.freeze_support()
+    mp.set_start_method('spawn')
+    main()
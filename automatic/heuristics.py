@@ -0,0 +1,174 @@
+import corepath
+from core import bitboard
+
+# Board evaluation functions used at the leaves of the search.
+#
+# Every evaluator is precomputed over the 65536 states of a 16-bit row, so
+# evaluating a packed board is a few table lookups: 4 for the snake weights
+# (one per row), 8 for the line evaluators (4 rows + the 4 rows of the
+# transposed board, that is the columns). Tables are built on first use.
+
+ROW_MASK = bitboard.ROW_MASK
+
+HEURISTIC = [[2**16,2**15,2**14,2**13],
+              [2**9, 2**10,2**11,2**12],
+              [2**8, 2**7, 2**6, 2**5],
+              [2,   2**2, 2**3, 2**4]]
+
+# Weights of the "combined" evaluator. The monotonicity and sum terms are
+# penalties, the constant base keeps the scores of live boards positive.
+COMBINED_WEIGHTS = {
+    "base": 200000.0,
+    "monotonicity": -47.0,
+    "sum": -11.0,
+    "merges": 700.0,
+    "empty": 270.0,
+    "smoothness": -10.0,
+}
+
+MONOTONICITY_POWER = 4
+SUM_POWER = 3.5
+
+# Terms of a single line of four exponents, column 0 first
+
+# Number of empty cells
+def line_empty(line):
+    return sum(1 for rank in line if rank == 0)
+
+# Number of tiles that would merge, consecutive equal tiles ignoring gaps
+def line_merges(line):
+    merges = 0
+    prev = 0
+    counter = 0
+
+    for rank in line:
+        if rank == 0: continue
+
+        if prev == rank:
+            counter += 1
+        elif counter > 0:
+            merges += 1 + counter
+            counter = 0
+
+        prev = rank
+
+    if counter > 0: merges += 1 + counter
+    return merges
+
+# How far the line is from being monotonic, the smaller of the increasing
+# and decreasing violations, weighted towards big tiles
+def line_monotonicity(line):
+    left = 0
+    right = 0
+
+    for i in range(3):
+        a = line[i] ** MONOTONICITY_POWER
+        b = line[i+1] ** MONOTONICITY_POWER
+
+        if line[i] > line[i+1]: left += a - b
+        else: right += b - a
+
+    return min(left, right)
+
+# Sum of the exponent differences between neighbouring tiles, ignoring gaps
+def line_smoothness(line):
+    tiles = [rank for rank in line if rank != 0]
+    return sum(abs(tiles[i] - tiles[i+1]) for i in range(len(tiles) - 1))
+
+# Sum of the exponents, weighted towards big tiles
+def line_sum(line):
+    return sum(rank ** SUM_POWER for rank in line)
+
+LINE_TERMS = {
+    "empty": line_empty,
+    "merges": line_merges,
+    "monotonicity": line_monotonicity,
+    "smoothness": line_smoothness,
+    "sum": line_sum,
+}
+
+# Dot product between the tile values and the HEURISTIC weights, the
+# original snake heuristic of the bot. With symmetric=True the board is
+# scored in its 8 orientations and the best one is kept, so the snake may
+# start in any corner.
+class SnakeEvaluator:
+    def __init__(self, weights=HEURISTIC, symmetric=False):
+        self.symmetric = symmetric
+        self.tables = []
+
+        for r in range(4):
+            table = [0] * 65536
+
+            for row in range(65536):
+                line = bitboard.unpack_row(row)
+                table[row] = sum(weights[r][c] << line[c] for c in range(4) if line[c])
+
+            self.tables.append(table)
+
+    def _score(self, board):
+        t0, t1, t2, t3 = self.tables
+        return (t0[board & ROW_MASK]
+                + t1[(board >> 16) & ROW_MASK]
+                + t2[(board >> 32) & ROW_MASK]
+                + t3[(board >> 48) & ROW_MASK])
+
+    def __call__(self, board):
+        if not self.symmetric: return self._score(board)
+        return max(self._score(symmetric) for symmetric in bitboard.symmetries(board))
+
+# Weighted sum of LINE_TERMS over the rows and the columns of the board.
+# Rows and columns are scored with the same table, so the evaluation is
+# the same for all 8 orientations of the board.
+class LineEvaluator:
+    symmetric = True
+
+    def __init__(self, weights):
+        unknown = [term for term in weights if term != "base" and term not in LINE_TERMS]
+        if unknown:
+            raise ValueError(f"Unknown heuristic terms: {', '.join(unknown)}")
+
+        # The base is split over the 8 lines
+        base = weights.get("base", 0.0) / 8
+        terms = [(LINE_TERMS[term], weight) for term, weight in weights.items() if term != "base"]
+
+        self.table = [0.0] * 65536
+
+        for row in range(65536):
+            line = bitboard.unpack_row(row)
+            self.table[row] = base + sum(weight * term(line) for term, weight in terms)
+
+    def __call__(self, board):
+        table = self.table
+        t = bitboard.transpose(board)
+
+        return (table[board & ROW_MASK]
+                + table[(board >> 16) & ROW_MASK]
+                + table[(board >> 32) & ROW_MASK]
+                + table[(board >> 48) & ROW_MASK]
+                + table[t & ROW_MASK]
+                + table[(t >> 16) & ROW_MASK]
+                + table[(t >> 32) & ROW_MASK]
+                + table[(t >> 48) & ROW_MASK])
+
+EVALUATORS = {
+    "snake": lambda: SnakeEvaluator(),
+    "snake8": lambda: SnakeEvaluator(symmetric=True),
+    "combined": lambda: LineEvaluator(COMBINED_WEIGHTS),
+    "monotonicity": lambda: LineEvaluator({"monotonicity": -1.0}),
+    "smoothness": lambda: LineEvaluator({"smoothness": -1.0}),
+    "empty": lambda: LineEvaluator({"empty": 1.0}),
+    "merges": lambda: LineEvaluator({"merges": 1.0}),
+}
+
+_evaluators = {}
+
+# Returns the evaluator with the given name, building its tables the first
+# time it is requested in this process
+def get_evaluator(name):
+    if name not in EVALUATORS:
+        raise ValueError(f"Unknown evaluator: {name}, available: {', '.join(EVALUATORS)}")
+
+    if name not in _evaluators:
+        _evaluators[name] = EVALUATORS[name]()
+
+    return _evaluators[name]
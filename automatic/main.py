@@ -4,9 +4,12 @@ import numpy as np
 import multiprocessing as mp
 import math
 import json
+import argparse
 
-from bot import Bot
+import profiling
+from bot import Bot, init_worker, init_profiled_worker
 from board import Board
+from searcher import BackgroundSearch
 
 INPUT_MAP = {
     pygame.K_UP: 0,
@@ -24,6 +27,26 @@ DIRECTIONS_MAP = {
 
 BOT = True
 
+# Search depth of the bot, ignored if TIME_BUDGET_MS is set
+DEPTH = 1
+# Per-move time budget in milliseconds for the iterative-deepening search,
+# None to always search at DEPTH
+TIME_BUDGET_MS = None
+# Leaf evaluation function of the bot, see heuristics.EVALUATORS
+EVALUATOR = "snake"
+# Persistent evaluation cache file shared by the pool workers and reused
+# across runs, None to disable it
+DISK_CACHE = None
+# Seed of the tile spawns, None for a random game
+SEED = None
+# File the game log is written to at game over, replay it with replay.py,
+# None to disable it
+GAME_LOG = None
+# Minimum time each position stays on screen before the bot's move is shown
+MOVE_DELAY_MS = 0
+# Search the likely next positions while the current move is displayed
+THINK_AHEAD = False
+
 def handle_input(board, event):    
     if event.type == pygame.KEYUP:
         if event.key == pygame.K_SPACE:
@@ -33,44 +56,105 @@ def handle_input(board, event):
             dir = DIRECTIONS_MAP[INPUT_MAP[event.key]]
             board.move(direction=dir)
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Plays 2048 in a window, with the bot or with the arrow keys")
+    parser.add_argument("--profile", default=None, metavar="DIR", help="profile the bot search, pool workers included, and write the merged report and collapsed stacks to DIR")
+    parser.add_argument("--profile-moves", type=int, default=200, help="number of bot moves played in profile mode")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
     globals.init()
 
     pygame.init()
     screen = pygame.display.set_mode((globals.WIDTH, globals.HEIGHT))
     clock = pygame.time.Clock()
 
+    screen.fill(pygame.Color(globals.BG_COLOR))
+    pygame.display.flip()
+
     global pool
     mp.freeze_support()
     mp.set_start_method('spawn')
 
-    board = Board()
-    bot = Bot()
+    board = Board(seed=SEED)
+    bot = Bot(evaluator=EVALUATOR, disk_cache=DISK_CACHE)
     running = True
 
-    pool = mp.Pool(processes=8)
+    # In profile mode the search thread and the pool workers are profiled,
+    # the window closes after profile_moves bot moves
+    profiler = None
+    moves = 0
+
+    if args.profile is not None:
+        profiling.prepare(args.profile)
+        profiler = profiling.Profiler("main")
+        pool = mp.Pool(processes=mp.cpu_count(), initializer=init_profiled_worker, initargs=(args.profile,))
+    else:
+        pool = mp.Pool(processes=mp.cpu_count(), initializer=init_worker)
+
+    # The bot searches in a background thread, the loop below only applies
+    # its moves, so the window stays responsive however deep the search is
+    search = BackgroundSearch(bot, depth=DEPTH, pool=pool, time_budget_ms=TIME_BUDGET_MS, think_ahead=THINK_AHEAD, profiler=profiler)
+    search.start()
+    if BOT: search.request(board.packed)
+
+    answer = None
+    last_move = pygame.time.get_ticks()
 
     while running:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
 
+            # The screen surface still holds the whole frame, push it again
+            if event.type == pygame.WINDOWEXPOSED:
+                pygame.display.flip()
+
             if not BOT: handle_input(board, event)
+            elif event.type == pygame.KEYUP and event.key == pygame.K_SPACE:
+                search.cancel()
+                answer = None
+                board.reset()
+                search.request(board.packed)
 
         if BOT:
-            action = bot.get_best_action(board, depth=1, pool=pool)
-            board.move(DIRECTIONS_MAP[action])
-        
+            answer = answer or search.poll()
+
+            if answer is not None and pygame.time.get_ticks() - last_move >= MOVE_DELAY_MS:
+                packed, action = answer
+                answer = None
+
+                if packed == board.packed and action is not None:
+                    board.move(DIRECTIONS_MAP[action])
+                    last_move = pygame.time.get_ticks()
+                    if not board.is_game_over(): search.request(board.packed)
+
+                    moves += 1
+                    if profiler is not None and moves >= args.profile_moves: running = False
+
         if board.is_game_over():
             print("GAME OVER, HIGHEST TILE: ", np.max(board.board))
+            if GAME_LOG is not None and board.log is not None: board.log.save(GAME_LOG)
             running = False
 
-        screen.fill(pygame.Color(globals.BG_COLOR))
-        board.render(pygame, screen)
+        # Only the cells that changed are redrawn and pushed to the window
+        dirty = board.render(pygame, screen)
+        if dirty: pygame.display.update(dirty)
 
-        pygame.display.flip()
         clock.tick(60)
 
+    search.stop()
+
+    if profiler is not None:
+        # Closing the pool lets the workers save their profiles
+        pool.close()
+        pool.join()
+        profiler.save(args.profile)
+        print(f"Profile written to {profiling.merge(args.profile)}")
+    else:
+        pool.terminate()
+
     pygame.quit()
 
 if __name__ == '__main__':
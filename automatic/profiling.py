@@ -0,0 +1,139 @@
+import cProfile
+import glob
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+# Profile mode of the runners (--profile in headless.py and main.py).
+#
+# Every process doing search work, the runner and each pool worker, profiles
+# the code run inside `with profiler:` blocks in two ways:
+#   - cProfile, for exact call counts and times per function
+#   - a sampling thread that records the stack of the profiled thread every
+#     SAMPLE_INTERVAL_S, for flame graphs
+# and saves them in the profile directory as <role>-<pid>.prof and
+# <role>-<pid>.collapsed when it is done. merge() then adds up the files of
+# all the processes into merged.prof, merged.txt (the report) and
+# merged.collapsed, in the collapsed-stack format read by flamegraph.pl and
+# speedscope: one "frame;frame;...;frame count" line per stack.
+#
+# The sampling thread needs the GIL to take a sample, so with CPU-bound code
+# samples are in practice taken every sys.getswitchinterval() (5 ms).
+
+SAMPLE_INTERVAL_S = 0.001
+
+# Functions listed in the report
+REPORT_LINES = 40
+
+class Profiler:
+    # role: name of the process in the file names and at the root of the
+    #   collapsed stacks, e.g. "main" or "worker"
+    def __init__(self, role, interval=SAMPLE_INTERVAL_S):
+        self.role = role
+        self.interval = interval
+        self.profile = cProfile.Profile()
+        self.samples = Counter()
+
+        # Profiled thread and number of frames above the profiled block,
+        # which are left out of the sampled stacks
+        self.thread_id = None
+        self.base_depth = 0
+
+        self.stopped = False
+        self.sampler = None
+
+    def __enter__(self):
+        if self.sampler is None:
+            self.sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+            self.sampler.start()
+
+        frame = sys._getframe(1)
+        depth = 0
+        while frame is not None:
+            depth += 1
+            frame = frame.f_back
+
+        self.base_depth = depth - 1
+        self.thread_id = threading.get_ident()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.disable()
+        self.thread_id = None
+
+    def _sample(self):
+        while not self.stopped:
+            time.sleep(self.interval)
+
+            thread_id = self.thread_id
+            if thread_id is None: continue
+
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+
+            stack.reverse()
+            self.samples[";".join([self.role] + stack[self.base_depth:])] += 1
+
+    # Stops the sampling thread and writes the profiles of this process
+    def save(self, directory):
+        self.stopped = True
+        self.profile.disable()
+
+        name = os.path.join(directory, f"{self.role}-{os.getpid()}")
+        self.profile.dump_stats(name + ".prof")
+        write_collapsed(name + ".collapsed", dict(self.samples))
+
+# Creates the profile directory, removing the files of a previous run
+def prepare(directory):
+    os.makedirs(directory, exist_ok=True)
+
+    for pattern in ("*.prof", "*.collapsed", "merged.txt"):
+        for path in glob.glob(os.path.join(directory, pattern)): os.remove(path)
+
+def write_collapsed(path, samples):
+    with open(path, "w") as f:
+        for stack, count in sorted(samples.items()):
+            f.write(f"{stack} {count}\n")
+
+def read_collapsed(path):
+    samples = Counter()
+
+    with open(path) as f:
+        for line in f:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if stack: samples[stack] += int(count)
+
+    return samples
+
+# Adds up the profiles saved by all the processes in directory, writes the
+# merged files and returns the path of the report
+def merge(directory):
+    profiles = sorted(path for path in glob.glob(os.path.join(directory, "*.prof")) if not path.endswith("merged.prof"))
+    collapsed = sorted(path for path in glob.glob(os.path.join(directory, "*.collapsed")) if not path.endswith("merged.collapsed"))
+
+    samples = Counter()
+    for path in collapsed: samples.update(read_collapsed(path))
+    write_collapsed(os.path.join(directory, "merged.collapsed"), samples)
+
+    report = os.path.join(directory, "merged.txt")
+
+    with open(report, "w") as f:
+        f.write(f"Processes: {len(profiles)}, samples: {sum(samples.values())}\n\n")
+        if not profiles: return report
+
+        stats = pstats.Stats(*profiles, stream=f)
+        stats.dump_stats(os.path.join(directory, "merged.prof"))
+
+        stats.sort_stats("tottime").print_stats(REPORT_LINES)
+        stats.sort_stats("cumulative").print_stats(REPORT_LINES)
+
+    return report
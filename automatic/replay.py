@@ -0,0 +1,55 @@
+import argparse
+import sys
+
+import corepath
+from board import Board
+from core import bitboard
+from core.gamelog import GameLog
+
+DIRECTIONS_MAP = bitboard.DIRECTIONS_MAP
+
+# Rebuilds the board of a logged game after its first upto moves (all of
+# them if None). The tile spawns come from the board RNG seeded as in the
+# logged game, so no search is needed and the cost is linear in the moves.
+def replay(log, upto=None):
+    if log.from_reset:
+        board = Board(seed=log.seed)
+    else:
+        board = Board(bitboard.to_lists(log.initial), seed=log.seed)
+
+    if board.packed != log.initial:
+        raise ValueError("The initial position does not match the seed of the log")
+
+    for dir in log.moves[:upto]:
+        board.move(DIRECTIONS_MAP[dir])
+
+    return board
+
+def print_board(board):
+    for row in board.board:
+        print(" ".join(f"{value:>6}" for value in row))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replays a game log written by headless.py, tournament.py or main.py")
+    parser.add_argument("log", help="game log file")
+    parser.add_argument("--move", type=int, default=None, help="show the board after this many moves, the final board by default")
+    parser.add_argument("--moves", action="store_true", help="also print the logged moves")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    log = GameLog.load(args.log)
+
+    upto = len(log) if args.move is None else max(0, min(args.move, len(log)))
+    board = replay(log, upto)
+
+    print(f"Seed: {log.seed}, moves: {len(log)}")
+    if args.moves: print("Moves: " + " ".join(DIRECTIONS_MAP[dir] for dir in log.moves))
+
+    print(f"After {upto} moves, score {board.score}:")
+    print_board(board)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import contextlib
+import queue
+import threading
+
+import corepath
+from board import Board
+from core import bitboard
+from bot import SearchCancelled
+
+# Runs the bot search in a background thread so that the window keeps
+# rendering and handling events while the bot thinks.
+#
+# request() posts the position whose move is wanted, poll() returns the
+# (packed board, direction) answers without blocking. cancel() drops the
+# pending request and aborts the running search, for example on reset.
+#
+# With think_ahead, once a move is found the thread searches the positions
+# that may follow it (every tile spawn after the move, the most likely
+# first) while the move is displayed. When the real next position is
+# requested its answer is usually ready, or already being computed.
+#
+# A profiling.Profiler given as profiler profiles the searches in the thread.
+class BackgroundSearch:
+    def __init__(self, bot, depth=1, pool=None, time_budget_ms=None, think_ahead=False, profiler=None):
+        self.bot = bot
+        self.depth = depth
+        self.pool = pool
+        self.time_budget_ms = time_budget_ms
+        self.think_ahead = think_ahead
+        self.profiler = profiler or contextlib.nullcontext()
+
+        self.results = queue.Queue()
+        self.condition = threading.Condition()
+        self.generation = 0
+        self.stopped = False
+
+        # Position requested by request() and not yet picked by the thread
+        self.target = None
+        # Position being searched by the thread and whether it is a guess
+        self.current = None
+        self.speculative = False
+        # The position being guessed was requested meanwhile, its answer is
+        # posted as soon as it is found
+        self.promoted = False
+        # Guessed positions still to search, and the answers already found
+        self.predictions = []
+        self.predicted = {}
+
+        self.thread = threading.Thread(target=self._run, name="bot-search", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    # Asks for the best move of the packed board
+    def request(self, packed):
+        with self.condition:
+            self.predictions = []
+
+            if packed in self.predicted:
+                self._post(packed, self.predicted[packed])
+                # The guess being searched is for the previous position
+                if self.current is not None: self.bot.cancel()
+            elif self.current == packed and self.speculative:
+                self.promoted = True
+            else:
+                self.target = packed
+                if self.current is not None: self.bot.cancel()
+
+            self.condition.notify()
+
+    # Returns the next (packed board, direction) answer, or None if there is
+    # none yet
+    def poll(self):
+        while True:
+            try:
+                generation, packed, action = self.results.get_nowait()
+            except queue.Empty:
+                return None
+
+            if generation == self.generation: return packed, action
+
+    # Forgets the pending request and the guesses, the running search is
+    # aborted and its answer is never returned by poll()
+    def cancel(self):
+        with self.condition:
+            self.generation += 1
+            self.target = None
+            self.promoted = False
+            self.predictions = []
+            self.predicted = {}
+            if self.current is not None: self.bot.cancel()
+
+    # Cancels everything and waits for the thread to exit
+    def stop(self, timeout=1.0):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+        self.cancel()
+        if self.thread.is_alive(): self.thread.join(timeout)
+
+    # Queues the answer, and with think_ahead the positions that can follow
+    # it. Called with the condition held.
+    def _post(self, packed, action):
+        self.results.put((self.generation, packed, action))
+        self.predicted = {}
+
+        if self.think_ahead and action is not None:
+            moved = bitboard.move(packed, action)
+            cells = bitboard.empty_indices(moved)
+            self.predictions = [moved | (1 << (4 * i)) for i in cells] + [moved | (2 << (4 * i)) for i in cells]
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.stopped and self.target is None and not self.predictions:
+                    self.condition.wait()
+
+                if self.stopped: return
+
+                if self.target is not None:
+                    packed, self.target = self.target, None
+                    self.speculative = False
+                else:
+                    packed = self.predictions.pop(0)
+                    self.speculative = True
+
+                self.current = packed
+                self.promoted = False
+                generation = self.generation
+                self.bot.cancelled = False
+
+            try:
+                with self.profiler:
+                    action = self.bot.get_best_action(Board.from_packed(packed), depth=self.depth, pool=self.pool, time_budget_ms=self.time_budget_ms)
+            except SearchCancelled:
+                action = None
+                generation = None
+
+            with self.condition:
+                self.current = None
+                if generation != self.generation: continue
+
+                if not self.speculative or self.promoted:
+                    self._post(packed, action)
+                else:
+                    self.predicted[packed] = action
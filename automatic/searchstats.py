@@ -0,0 +1,127 @@
+from collections import Counter
+
+# Counters of what the search did, filled by the Bot when it is created with
+# stats=True. The bot keeps one SearchStats per move (Bot.last_stats); the
+# records of the moves of a game are added up with merge().
+#
+# Layers are keyed on the remaining depth of the node: half depths are max
+# (direction) layers, whole depths are chance (tile spawn) layers, the root
+# children are searched at the requested depth.
+class SearchStats:
+    def __init__(self):
+        self.moves = 0
+        # Expanded nodes and the children they generated, per layer
+        self.max_nodes = Counter()
+        self.chance_nodes = Counter()
+        self.max_children = Counter()
+        self.chance_children = Counter()
+        # Nodes scored by the evaluator: depth exhausted, or probability
+        # below the cutoff (pruned)
+        self.leaves = 0
+        self.pruned = 0
+        # Every node checks its legal moves, a node without any is game over
+        self.game_over_checks = 0
+        self.game_overs = 0
+        self.cache_hits = 0
+        self.disk_hits = 0
+        # Seconds spent in search tasks by every pool worker, keyed by pid
+        self.process_time = Counter()
+        self.wall_time = 0.0
+        # Depth of the deepest completed iteration of each move, with a time
+        # budget
+        self.completed_depths = Counter()
+
+    def nodes(self):
+        return sum(self.max_nodes.values()) + sum(self.chance_nodes.values())
+
+    # Adds the counters of another record to this one
+    def merge(self, other):
+        self.moves += other.moves
+        self.max_nodes.update(other.max_nodes)
+        self.chance_nodes.update(other.chance_nodes)
+        self.max_children.update(other.max_children)
+        self.chance_children.update(other.chance_children)
+        self.leaves += other.leaves
+        self.pruned += other.pruned
+        self.game_over_checks += other.game_over_checks
+        self.game_overs += other.game_overs
+        self.cache_hits += other.cache_hits
+        self.disk_hits += other.disk_hits
+        self.process_time.update(other.process_time)
+        self.wall_time += other.wall_time
+        self.completed_depths.update(other.completed_depths)
+        return self
+
+    # Plain dict for JSON reports, with the branching factor of every layer
+    def to_dict(self):
+        layers = sorted(set(self.max_nodes) | set(self.chance_nodes), reverse=True)
+        nodes = self.nodes()
+
+        return {
+            "moves": self.moves,
+            "nodes": nodes,
+            "layers": [{
+                "depth": depth,
+                "kind": "max" if depth != int(depth) else "chance",
+                "nodes": self.max_nodes[depth] + self.chance_nodes[depth],
+                "children": self.max_children[depth] + self.chance_children[depth],
+                "branching": (self.max_children[depth] + self.chance_children[depth]) / (self.max_nodes[depth] + self.chance_nodes[depth]),
+            } for depth in layers],
+            "leaves": self.leaves,
+            "pruned": self.pruned,
+            "game_over_checks": self.game_over_checks,
+            "game_overs": self.game_overs,
+            "cache_hits": self.cache_hits,
+            "disk_hits": self.disk_hits,
+            "cache_hit_rate": self.cache_hits / (self.cache_hits + nodes) if nodes else 0.0,
+            "process_time_s": {str(pid): seconds for pid, seconds in sorted(self.process_time.items())},
+            "wall_time_s": self.wall_time,
+            "nodes_per_s": nodes / self.wall_time if self.wall_time else 0.0,
+            "completed_depths": {str(depth): count for depth, count in sorted(self.completed_depths.items())},
+        }
+
+    # Rebuilds a record from to_dict(), e.g. read back from a JSON report
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.moves = data["moves"]
+
+        for layer in data["layers"]:
+            depth = layer["depth"]
+
+            if layer["kind"] == "max":
+                stats.max_nodes[depth] = layer["nodes"]
+                stats.max_children[depth] = layer["children"]
+            else:
+                stats.chance_nodes[depth] = layer["nodes"]
+                stats.chance_children[depth] = layer["children"]
+
+        stats.leaves = data["leaves"]
+        stats.pruned = data["pruned"]
+        stats.game_over_checks = data["game_over_checks"]
+        stats.game_overs = data["game_overs"]
+        stats.cache_hits = data["cache_hits"]
+        stats.disk_hits = data["disk_hits"]
+        stats.process_time = Counter({int(pid): seconds for pid, seconds in data["process_time_s"].items()})
+        stats.wall_time = data["wall_time_s"]
+        stats.completed_depths = Counter({float(depth): count for depth, count in data["completed_depths"].items()})
+        return stats
+
+def print_stats(stats):
+    data = stats.to_dict()
+    moves = max(data["moves"], 1)
+
+    print(f"Search: {data['moves']} moves, {data['nodes']} nodes ({data['nodes'] / moves:.1f}/move), {data['nodes_per_s']:.0f} nodes/s, wall {data['wall_time_s']:.2f}s")
+    print(f"{'depth':>7} {'kind':>7} {'nodes':>12} {'per move':>10} {'branching':>10}")
+
+    for layer in data["layers"]:
+        print(f"{layer['depth']:>7} {layer['kind']:>7} {layer['nodes']:>12} {layer['nodes'] / moves:>10.1f} {layer['branching']:>10.2f}")
+
+    print(f"Leaves: {data['leaves']} ({data['pruned']} pruned), game-over checks: {data['game_over_checks']} ({data['game_overs']} game over)")
+    print(f"Cache hits: {data['cache_hits']} ({data['cache_hit_rate']:.1%}), from the disk cache: {data['disk_hits']}")
+
+    if data["completed_depths"]:
+        print("Completed depths: " + ", ".join(f"{depth}: {count}" for depth, count in data["completed_depths"].items()))
+
+    if data["process_time_s"]:
+        print("Worker time (s): " + ", ".join(f"{pid} {seconds:.2f}" for pid, seconds in data["process_time_s"].items()))
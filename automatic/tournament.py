@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from bot import Bot
+from headless import play_game, summarize, print_report
+
+# How many times a game is played again after its worker process died on
+# its own
+MAX_RETRIES = 2
+
+# Arguments that change the games played. They are stored in the first
+# record of the results file, and a file is only resumed with the same ones.
+SETTINGS = ("depth", "time_budget_ms", "max_moves", "seed", "cache_size", "prob_cutoff", "sample_cells", "evaluator")
+
+def game_settings(args):
+    return {name: getattr(args, name) for name in SETTINGS}
+
+# Plays one game in a pool worker with its own serial Bot. The tile spawns and
+# the bot are seeded with the game seed, so without a time budget the game is
+# reproducible.
+def run_game(game, seed, depth, time_budget_ms, max_moves, bot_args, log_dir=None):
+    random.seed(seed)
+    bot = Bot(seed=seed, **bot_args)
+    log_path = os.path.join(log_dir, f"game-{game}.log") if log_dir is not None else None
+
+    start = time.perf_counter()
+    result = play_game(bot, depth, time_budget_ms, None, max_moves, seed, log_path)
+    result["latencies"] = [round(latency, 6) for latency in result["latencies"]]
+    # Only the game totals of the search stats are kept in the results file
+    result.pop("move_stats", None)
+
+    return {"game": game, "seed": seed, "elapsed_s": time.perf_counter() - start, **result}
+
+# Reads the results file: returns the stored settings (None if there are
+# none) and the games already played, keyed by game index. Failed games are
+# left out, a resumed run plays them again.
+def load_results(path):
+    settings = None
+    results = {}
+    if not os.path.exists(path): return settings, results
+
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line: continue
+
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut by an interruption, the game is played again
+                continue
+
+            if "settings" in record:
+                settings = record["settings"]
+                continue
+
+            if "error" in record: continue
+            results[record["game"]] = record
+
+    return settings, results
+
+def _write(out, record):
+    out.write(json.dumps(record) + "\n")
+    out.flush()
+
+# Runs the given games on a fresh executor of the given size, writing every
+# finished game as soon as it arrives. Returns the games lost to a dead
+# worker: the executor fails all its pending games when one worker dies, so
+# they are not necessarily the ones that crashed.
+def _run_batch(games, processes, args, bot_args, out, results):
+    broken = []
+    context = mp.get_context("spawn")
+
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+        futures = {executor.submit(run_game, game, args.seed + game, args.depth, args.time_budget_ms, args.max_moves, bot_args, args.log_dir): game for game in games}
+
+        try:
+            for future in as_completed(futures):
+                game = futures[future]
+
+                try:
+                    record = future.result()
+                except BrokenProcessPool:
+                    broken.append(game)
+                    continue
+                except Exception as e:
+                    record = {"game": game, "seed": args.seed + game, "error": repr(e)}
+
+                results[game] = record
+                _write(out, record)
+
+                if "error" not in record:
+                    print(f"Game {game}: score {record['score']}, max tile {record['max_tile']}, moves {record['moves']}")
+                else:
+                    print(f"Game {game} failed: {record['error']}")
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    return sorted(broken)
+
+# Plays a game lost to a dead worker alone on its own executor, so a crash
+# can only be its own. It is played again up to MAX_RETRIES times before
+# being recorded as failed.
+def _run_isolated(game, args, bot_args, out, results):
+    for _ in range(MAX_RETRIES + 1):
+        if not _run_batch([game], 1, args, bot_args, out, results): return
+
+    record = {"game": game, "seed": args.seed + game, "error": "worker process died"}
+    results[game] = record
+    _write(out, record)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Plays many independent 2048 games in parallel, one serial bot per worker")
+    parser.add_argument("--games", type=int, default=100, help="number of games of the tournament")
+    parser.add_argument("--processes", type=int, default=mp.cpu_count(), help="number of worker processes")
+    parser.add_argument("--output", default="tournament.jsonl", help="results file, one JSON line per game; an existing file is resumed")
+    parser.add_argument("--depth", type=float, default=1, help="search depth")
+    parser.add_argument("--time-budget-ms", type=float, default=None, help="per-move time budget, enables iterative deepening")
+    parser.add_argument("--max-moves", type=int, default=None, help="stop every game after this many moves")
+    parser.add_argument("--seed", type=int, default=0, help="game i is played with seed + i")
+    parser.add_argument("--cache-size", type=int, default=100000)
+    parser.add_argument("--prob-cutoff", type=float, default=0.0)
+    parser.add_argument("--sample-cells", type=int, default=None)
+    parser.add_argument("--evaluator", default="snake", help="leaf evaluation function, see heuristics.EVALUATORS")
+    parser.add_argument("--disk-cache", default=None, help="persistent evaluation cache file shared across runs and workers")
+    parser.add_argument("--stats", action="store_true", help="record and report search statistics (nodes per layer, cache hits, worker time)")
+    parser.add_argument("--log-dir", default=None, help="write the log of every game to this directory, see replay.py")
+    parser.add_argument("--json", default=None, help="also write the final report to this file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    bot_args = {"cache_size": args.cache_size, "prob_cutoff": args.prob_cutoff, "sample_cells": args.sample_cells, "evaluator": args.evaluator, "disk_cache": args.disk_cache, "stats": args.stats}
+
+    if args.log_dir is not None: os.makedirs(args.log_dir, exist_ok=True)
+
+    settings = game_settings(args)
+    stored, results = load_results(args.output)
+
+    # Games played with other settings cannot go in the same report
+    if stored is None and results:
+        print(f"{args.output} has no settings record, it cannot be resumed safely; use another --output")
+        return 1
+
+    if stored is not None and stored != settings:
+        changed = ", ".join(f"{name} {stored.get(name)!r} -> {settings[name]!r}" for name in SETTINGS if stored.get(name) != settings[name])
+        print(f"{args.output} was played with other settings ({changed}); use the same arguments or another --output")
+        return 1
+
+    pending = [game for game in range(args.games) if game not in results]
+    new_games = set(pending)
+
+    if len(pending) < args.games:
+        print(f"Resuming {args.output}: {args.games - len(pending)} games already played, {len(pending)} left")
+
+    start = time.perf_counter()
+
+    with open(args.output, "a") as out:
+        # Terminate a line cut by an interruption before appending new games
+        if out.tell() > 0:
+            with open(args.output, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n": out.write("\n")
+
+        if stored is None: _write(out, {"settings": settings})
+
+        for game in _run_batch(pending, args.processes, args, bot_args, out, results):
+            _run_isolated(game, args, bot_args, out, results)
+
+    elapsed = time.perf_counter() - start
+
+    played = [record for game, record in sorted(results.items()) if game < args.games and "error" not in record]
+    errors = sum(1 for game, record in results.items() if game < args.games and "error" in record)
+
+    report = summarize(played, elapsed)
+    # Throughput only counts the games played by this run
+    report["games_per_s"] = len(new_games) / elapsed if elapsed else 0.0
+    report["moves_per_s"] = sum(results[game].get("moves", 0) for game in new_games) / elapsed if elapsed else 0.0
+    report["errors"] = errors
+
+    print_report(report)
+    if errors: print(f"Failed games: {errors}")
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    return 0
+
+if __name__ == '__main__':
+    mp.freeze_support()
+    sys.exit(main())
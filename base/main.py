@@ -14,6 +14,10 @@ def handle_input(board):
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
             running = False
+
+        # The screen surface still holds the whole frame, push it again
+        if event.type == pygame.WINDOWEXPOSED:
+            pygame.display.flip()
         
         if event.type == pygame.KEYUP:
             if event.key == pygame.K_SPACE:
@@ -33,6 +37,11 @@ def main():
 
     board = Board()
 
+    # The background is drawn once, every frame only pushes the tiles that
+    # changed
+    screen.fill(pygame.Color(globals.BG_COLOR))
+    pygame.display.flip()
+
     while running:
         handle_input(board)
         
@@ -40,10 +49,9 @@ def main():
             print("GAME OVER, HIGHEST TILE: ", np.max(board.board))
             running = False
 
-        screen.fill(pygame.Color(globals.BG_COLOR))
-        board.render(pygame, screen)
+        dirty = board.render(pygame, screen)
+        if dirty: pygame.display.update(dirty)
 
-        pygame.display.flip()
         clock.tick(60)
     
     pygame.quit()
@@ -0,0 +1,14 @@
+# Game rules shared by the three front-ends: the manual game (base), the bot
+# (automatic) and the reinforcement learning environment (experiments).
+#
+#   bitboard: packed 64-bit boards and table-driven moves, the engine
+#   batch: the same rules applied to N boards at once with NumPy
+#   board: the Board class of the game windows and the bot, over bitboard
+#   gamelog: compact binary logs of seeded games
+#   renderer: cached drawing of a board in a pygame window
+#   conformance: checks that all of the above follow the same rules
+#
+# The front-ends run as scripts from their own folder and put the repository
+# root on sys.path to import the package: automatic in its corepath module,
+# base in board.py and experiments in gymcustomenv.py, their only modules
+# importing core.
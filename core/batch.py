@@ -0,0 +1,162 @@
+import numpy as np
+from . import bitboard
+
+# Batch engine: applies the 2048 rules to N boards at once.
+#
+# A batch is an (N, 4, 4) uint8 array of tile exponents (0 for an empty cell,
+# 1 for a 2, 2 for a 4, ...). Every row is packed into a 16-bit index and
+# moved with the same lookup tables used by bitboard.py, so a move over the
+# whole batch is a handful of NumPy operations with no per-board Python code.
+
+UP, DOWN, LEFT, RIGHT = bitboard.UP, bitboard.DOWN, bitboard.LEFT, bitboard.RIGHT
+
+ROW_LEFT = np.array(bitboard.ROW_LEFT, dtype=np.uint16)
+ROW_RIGHT = np.array(bitboard.ROW_RIGHT, dtype=np.uint16)
+ROW_SCORE = np.array(bitboard.ROW_SCORE, dtype=np.int64)
+ROW_MOVES = np.array(bitboard.ROW_MOVES, dtype=np.uint8)
+
+NIBBLE_SHIFTS = np.array([0, 4, 8, 12], dtype=np.uint16)
+
+# Tile value of every exponent, VALUES[0] is the empty cell
+VALUES = np.array([0] + [1 << e for e in range(1, 16)], dtype=np.int64)
+
+# Packs the rows of an (..., 4) exponent array into 16-bit row indices
+def pack_rows(rows):
+    rows = rows.astype(np.uint16)
+    return rows[..., 0] | (rows[..., 1] << 4) | (rows[..., 2] << 8) | (rows[..., 3] << 12)
+
+# Unpacks 16-bit row indices into an (..., 4) exponent array
+def unpack_rows(packed):
+    return ((packed[..., None] >> NIBBLE_SHIFTS) & 0xF).astype(np.uint8)
+
+# Returns an empty batch of n boards
+def empty(n):
+    return np.zeros((n, 4, 4), dtype=np.uint8)
+
+# Converts tile values (anything shaped (N, 4, 4)) into exponents
+def from_values(values):
+    values = np.asarray(values, dtype=np.int64)
+    if values.size and values.max() > VALUES[-1]:
+        raise ValueError(f"Tiles above the highest tile {VALUES[-1]}")
+
+    exponents = np.zeros(values.shape, dtype=np.uint8)
+    nonzero = values > 0
+    exponents[nonzero] = np.log2(values[nonzero]).astype(np.uint8)
+    return exponents
+
+# Converts exponents into tile values, optionally into a preallocated
+# int64 array
+def to_values(boards, out=None):
+    return np.take(VALUES, boards, out=out)
+
+# Exponent of every plane of the one-hot encoding
+PLANES = np.arange(16, dtype=np.uint8).reshape(16, 1, 1)
+
+# One-hot encoding of (..., 4, 4) exponents as (..., 16, 4, 4) uint8 planes,
+# plane e marks the cells holding exponent e (plane 0 the empty cells).
+# out is an optional preallocated bool array of the same shape, the result
+# is a uint8 view of it.
+def to_onehot(boards, out=None):
+    return np.equal(boards[..., None, :, :], PLANES, out=out).view(np.uint8)
+
+# Packs (..., 4, 4) exponents into the 64-bit boards of bitboard.py, cell
+# (r, c) in bits 4 * (4r + c). The four 16-bit rows of a board are
+# contiguous in little-endian order, so they are reinterpreted as one uint64
+# without copying.
+def to_packed(boards):
+    rows = np.ascontiguousarray(pack_rows(boards), dtype="<u2")
+    return rows.view("<u8")[..., 0]
+
+# Unpacks 64-bit boards into (..., 4, 4) exponents
+def from_packed(packed):
+    packed = np.asarray(packed, dtype=np.uint64)
+    rows = (packed[..., None] >> np.array([0, 16, 32, 48], dtype=np.uint64)) & np.uint64(0xFFFF)
+    return unpack_rows(rows.astype(np.uint16))
+
+# Moves every board in the given direction (0: up, 1: down, 2: left, 3: right)
+# without spawning tiles. Returns the moved boards, the score gained by each
+# board and a mask of the boards that changed.
+def move(boards, direction):
+    lines = boards.transpose(0, 2, 1) if direction in (UP, DOWN) else boards
+    packed = pack_rows(lines)
+
+    table = ROW_LEFT if direction in (UP, LEFT) else ROW_RIGHT
+    moved = unpack_rows(table[packed])
+    gains = ROW_SCORE[packed].sum(axis=1)
+
+    if direction in (UP, DOWN):
+        moved = moved.transpose(0, 2, 1)
+
+    moved = np.ascontiguousarray(moved)
+    changed = (moved != boards).any(axis=(1, 2))
+
+    return moved, gains, changed
+
+# Same as move, but every board is moved in its own direction
+def move_each(boards, directions):
+    moved = np.empty_like(boards)
+    gains = np.zeros(len(boards), dtype=np.int64)
+    changed = np.zeros(len(boards), dtype=bool)
+
+    for direction in range(4):
+        selected = directions == direction
+        if not selected.any(): continue
+
+        moved[selected], gains[selected], changed[selected] = move(boards[selected], direction)
+
+    return moved, gains, changed
+
+# Returns an (N, 4) mask of the legal moves, column d is True if moving the
+# board in direction d changes it
+def legal_moves(boards):
+    rows = np.bitwise_or.reduce(ROW_MOVES[pack_rows(boards)], axis=1)
+    cols = np.bitwise_or.reduce(ROW_MOVES[pack_rows(boards.transpose(0, 2, 1))], axis=1)
+
+    return np.stack([cols & 1, cols >> 1, rows & 1, rows >> 1], axis=1).astype(bool)
+
+# Mask of the boards where no move is possible, the same definition as
+# bitboard.is_game_over (an empty board is game over too)
+def is_game_over(boards):
+    return ~legal_moves(boards).any(axis=1)
+
+# Spawns a tile (2 with 90% probability, 4 otherwise) in a random empty cell
+# of every board selected by mask (all boards if mask is None), in place.
+# Boards without empty cells are left untouched.
+def add_random_tiles(boards, rng, mask=None):
+    flat = boards.reshape(len(boards), 16)
+    empty_cells = flat == 0
+
+    selected = empty_cells.any(axis=1)
+    if mask is not None: selected &= mask
+
+    rows = np.flatnonzero(selected)
+    if len(rows) == 0: return boards
+
+    # The argmax of uniform noise restricted to the empty cells picks one of
+    # them uniformly at random
+    noise = rng.random((len(rows), 16))
+    noise[~empty_cells[rows]] = -1.0
+    cells = noise.argmax(axis=1)
+
+    values = np.where(rng.random(len(rows)) < 0.9, 1, 2).astype(np.uint8)
+    flat[rows, cells] = values
+
+    # reshape copies non-contiguous batches, write the result back
+    if not np.shares_memory(flat, boards):
+        boards[...] = flat.reshape(boards.shape)
+
+    return boards
+
+# Clears the boards selected by mask and gives them two random tiles, in place
+def reset_where(boards, mask, rng):
+    boards[mask] = 0
+    add_random_tiles(boards, rng, mask)
+    add_random_tiles(boards, rng, mask)
+    return boards
+
+# Returns n new boards with two random tiles each
+def reset(n, rng):
+    boards = empty(n)
+    add_random_tiles(boards, rng)
+    add_random_tiles(boards, rng)
+    return boards
@@ -0,0 +1,332 @@
+import random
+
+# Packed representation of a 2048 board.
+#
+# A board is a single 64-bit integer: every cell holds the exponent of its tile
+# (0 for an empty cell, 1 for a 2, 2 for a 4, ... 15 for a 32768) in 4 bits.
+# Cell (row, col) lives at bit offset 4 * (4 * row + col), so row r is the
+# 16-bit slice (board >> 16 * r) & 0xFFFF and, inside a row, column 0 is the
+# lowest nibble.
+#
+# Every move is answered with precomputed lookup tables indexed by the 16-bit
+# row (or column) state, so a full move is four table lookups instead of the
+# slide/merge/slide pipeline on lists.
+
+UP, DOWN, LEFT, RIGHT = 0, 1, 2, 3
+
+DIRECTIONS_MAP = {
+    0: "up",
+    1: "down",
+    2: "left",
+    3: "right",
+}
+
+DIRECTIONS_INDEX = {name: dir for dir, name in DIRECTIONS_MAP.items()}
+
+ROW_MASK = 0xFFFF
+COL_MASK = 0x000F000F000F000F
+MAX_EXPONENT = 15
+
+# Splits a 16-bit row into its four exponents, column 0 first
+def unpack_row(row):
+    return [(row >> (4 * i)) & 0xF for i in range(4)]
+
+# Packs four exponents, column 0 first, into a 16-bit row
+def pack_row(line):
+    return line[0] | (line[1] << 4) | (line[2] << 8) | (line[3] << 12)
+
+# Mirrors a 16-bit row, column 0 becomes column 3 and so on
+def reverse_row(row):
+    return ((row >> 12) & 0xF) | ((row >> 4) & 0xF0) | ((row << 4) & 0xF00) | ((row << 12) & 0xF000)
+
+# Spreads a 16-bit row over a board column: nibble i goes to row i, column 0
+def unpack_col(row):
+    return (row & 0xF) | ((row & 0xF0) << 12) | ((row & 0xF00) << 24) | ((row & 0xF000) << 36)
+
+# Slides and merges a single line towards column 0, the same rules as
+# conformance.reference_line. Two 32768 tiles (exponent 15)
+# are not merged because the result would not fit in a nibble.
+# Returns the new line and the score gained by the merges.
+def _move_line_left(line):
+    tiles = [tile for tile in line if tile != 0]
+    merged = []
+    score = 0
+    i = 0
+
+    while i < len(tiles):
+        if i + 1 < len(tiles) and tiles[i] == tiles[i+1] and tiles[i] < MAX_EXPONENT:
+            merged.append(tiles[i] + 1)
+            score += 1 << (tiles[i] + 1)
+            i += 2
+        else:
+            merged.append(tiles[i])
+            i += 1
+
+    return merged + [0] * (4 - len(merged)), score
+
+def _build_tables():
+    row_left = [0] * 65536
+    row_right = [0] * 65536
+    row_score = [0] * 65536
+
+    for row in range(65536):
+        line, score = _move_line_left(unpack_row(row))
+        row_left[row] = pack_row(line)
+        row_score[row] = score
+
+    for row in range(65536):
+        row_right[row] = reverse_row(row_left[reverse_row(row)])
+
+    col_up = [unpack_col(row) for row in row_left]
+    col_down = [unpack_col(row) for row in row_right]
+
+    return row_left, row_right, row_score, col_up, col_down
+
+# ROW_LEFT[row] / ROW_RIGHT[row]: the row after a left / right move
+# COL_UP[row] / COL_DOWN[row]: the same move applied to a column, already
+#   spread over column 0 of a board (see unpack_col)
+# ROW_SCORE[row]: the score gained by moving the row, equal for both directions
+ROW_LEFT, ROW_RIGHT, ROW_SCORE, COL_UP, COL_DOWN = _build_tables()
+
+# ROW_MOVES[row]: bit 0 set if a left move changes the row, bit 1 if a right
+# move does. Applied to the columns of the transposed board the same bits
+# answer up and down.
+ROW_MOVES = [(ROW_LEFT[row] != row) | ((ROW_RIGHT[row] != row) << 1) for row in range(65536)]
+
+# Swaps rows and columns: cell (row, col) goes to (col, row)
+def transpose(board):
+    a1 = board & 0xF0F00F0FF0F00F0F
+    a2 = board & 0x0000F0F00000F0F0
+    a3 = board & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+# ROW_EMPTY[row]: 4-bit mask of the empty cells of the row, bit c for column c
+# ROW_MAX[row]: the highest exponent of the row
+ROW_EMPTY = [sum(1 << c for c in range(4) if (row >> (4 * c)) & 0xF == 0) for row in range(65536)]
+ROW_MAX = [max(unpack_row(row)) for row in range(65536)]
+
+# Zobrist keys: ZOBRIST[cell][exponent] is a fixed random 64-bit key, 0 for
+# an empty cell. The hash of a board is the XOR of the keys of its cells.
+_zobrist_rng = random.Random(0x2048)
+ZOBRIST = [[0] + [_zobrist_rng.getrandbits(64) for _ in range(15)] for _ in range(16)]
+
+# 16-bit mask of the empty cells, bit i for cell i = 4 * row + col
+def empty_mask(board):
+    return (ROW_EMPTY[board & ROW_MASK]
+            | (ROW_EMPTY[(board >> 16) & ROW_MASK] << 4)
+            | (ROW_EMPTY[(board >> 32) & ROW_MASK] << 8)
+            | (ROW_EMPTY[(board >> 48) & ROW_MASK] << 12))
+
+# Indices (4 * row + col) of the cells set in a 16-bit cell mask
+def mask_indices(mask):
+    indices = []
+
+    while mask:
+        low = mask & -mask
+        indices.append(low.bit_length() - 1)
+        mask ^= low
+
+    return indices
+
+# Indices (4 * row + col) of the empty cells
+def empty_indices(board):
+    return mask_indices(empty_mask(board))
+
+# Highest exponent on the board
+def max_exponent(board):
+    return max(ROW_MAX[board & ROW_MASK], ROW_MAX[(board >> 16) & ROW_MASK], ROW_MAX[(board >> 32) & ROW_MASK], ROW_MAX[board >> 48])
+
+# Zobrist hash of the board, see ZOBRIST. The search keys its tables on the
+# packed board itself, so the hash is computed only when asked for.
+def zobrist(board):
+    key = 0
+    for cell in range(16):
+        key ^= ZOBRIST[cell][(board >> (4 * cell)) & 0xF]
+
+    return key
+
+# REVERSE_ROW[row]: the row mirrored, see reverse_row
+REVERSE_ROW = [reverse_row(row) for row in range(65536)]
+
+# Mirrors the board left to right: cell (row, col) goes to (row, 3 - col)
+def flip_horizontal(board):
+    return (REVERSE_ROW[board & ROW_MASK]
+            | (REVERSE_ROW[(board >> 16) & ROW_MASK] << 16)
+            | (REVERSE_ROW[(board >> 32) & ROW_MASK] << 32)
+            | (REVERSE_ROW[(board >> 48) & ROW_MASK] << 48))
+
+# Mirrors the board top to bottom: cell (row, col) goes to (3 - row, col)
+def flip_vertical(board):
+    return (((board & ROW_MASK) << 48)
+            | (((board >> 16) & ROW_MASK) << 32)
+            | (((board >> 32) & ROW_MASK) << 16)
+            | (board >> 48))
+
+# Returns the 8 symmetric versions of the board (the rotations and
+# reflections of the square). Entry k is the board with transform k applied:
+# bit 0 of k flips horizontally, bit 1 flips vertically and bit 2 transposes,
+# in this order.
+def symmetries(board):
+    h = flip_horizontal(board)
+    v = flip_vertical(board)
+    hv = flip_vertical(h)
+    return [board, h, v, hv, transpose(board), transpose(h), transpose(v), transpose(hv)]
+
+# Applies transform k (see symmetries) to a single board
+def apply_transform(board, transform):
+    if transform & 1: board = flip_horizontal(board)
+    if transform & 2: board = flip_vertical(board)
+    if transform & 4: board = transpose(board)
+    return board
+
+# Undoes transform k, the three steps are involutions applied in reverse
+def invert_transform(board, transform):
+    if transform & 4: board = transpose(board)
+    if transform & 2: board = flip_vertical(board)
+    if transform & 1: board = flip_horizontal(board)
+    return board
+
+# Maps a direction on a board to the equivalent direction on the board with
+# transform k applied, so that
+# move(apply_transform(b, k), transform_direction(d, k)) == apply_transform(move(b, d), k)
+def transform_direction(direction, transform):
+    if transform & 1 and direction in (LEFT, RIGHT): direction ^= 1
+    if transform & 2 and direction in (UP, DOWN): direction ^= 1
+    if transform & 4: direction ^= 2
+    return direction
+
+# Maps a direction on the transformed board back to the original board
+def invert_direction(direction, transform):
+    if transform & 4: direction ^= 2
+    if transform & 2 and direction in (UP, DOWN): direction ^= 1
+    if transform & 1 and direction in (LEFT, RIGHT): direction ^= 1
+    return direction
+
+# Returns the canonical orientation of the board, the smallest of its 8
+# symmetric versions, and the transform that produces it. Boards that are
+# rotations or reflections of each other share the same canonical board.
+def canonical(board):
+    best = board
+    best_transform = 0
+
+    for transform, symmetric in enumerate(symmetries(board)):
+        if symmetric < best:
+            best = symmetric
+            best_transform = transform
+
+    return best, best_transform
+
+# Same as canonical, without the transform
+def canonical_key(board):
+    return min(symmetries(board))
+
+# Moves the board in the given direction (0: up, 1: down, 2: left, 3: right)
+# without spawning a new tile
+def move(board, direction):
+    if direction == LEFT:
+        return (ROW_LEFT[board & ROW_MASK]
+                | (ROW_LEFT[(board >> 16) & ROW_MASK] << 16)
+                | (ROW_LEFT[(board >> 32) & ROW_MASK] << 32)
+                | (ROW_LEFT[(board >> 48) & ROW_MASK] << 48))
+
+    if direction == RIGHT:
+        return (ROW_RIGHT[board & ROW_MASK]
+                | (ROW_RIGHT[(board >> 16) & ROW_MASK] << 16)
+                | (ROW_RIGHT[(board >> 32) & ROW_MASK] << 32)
+                | (ROW_RIGHT[(board >> 48) & ROW_MASK] << 48))
+
+    table = COL_UP if direction == UP else COL_DOWN
+    t = transpose(board)
+    return (table[t & ROW_MASK]
+            | (table[(t >> 16) & ROW_MASK] << 4)
+            | (table[(t >> 32) & ROW_MASK] << 8)
+            | (table[(t >> 48) & ROW_MASK] << 12))
+
+# Score gained by moving the board in the given direction
+def move_score(board, direction):
+    if direction in (UP, DOWN):
+        board = transpose(board)
+
+    return (ROW_SCORE[board & ROW_MASK]
+            + ROW_SCORE[(board >> 16) & ROW_MASK]
+            + ROW_SCORE[(board >> 32) & ROW_MASK]
+            + ROW_SCORE[(board >> 48) & ROW_MASK])
+
+# Returns the legal moves as a 4-bit mask, bit d is set if moving in
+# direction d changes the board. Only table lookups, no move is simulated.
+def legal_moves(board):
+    rows = (ROW_MOVES[board & ROW_MASK]
+            | ROW_MOVES[(board >> 16) & ROW_MASK]
+            | ROW_MOVES[(board >> 32) & ROW_MASK]
+            | ROW_MOVES[(board >> 48) & ROW_MASK])
+
+    t = transpose(board)
+    cols = (ROW_MOVES[t & ROW_MASK]
+            | ROW_MOVES[(t >> 16) & ROW_MASK]
+            | ROW_MOVES[(t >> 32) & ROW_MASK]
+            | ROW_MOVES[(t >> 48) & ROW_MASK])
+
+    # cols holds (up, down) and rows holds (left, right)
+    return cols | (rows << 2)
+
+# Checks whether no move changes the board
+def is_game_over(board):
+    return legal_moves(board) == 0
+
+# Returns the exponent stored in the cell
+def get_cell(board, row, col):
+    return (board >> (4 * (4 * row + col))) & 0xF
+
+# Returns a board with the exponent stored in the cell
+def set_cell(board, row, col, exponent):
+    shift = 4 * (4 * row + col)
+    return (board & ~(0xF << shift)) | (exponent << shift)
+
+# Returns the (row, col) positions of the empty cells
+def empty_cells(board):
+    return [(i >> 2, i & 3) for i in empty_indices(board)]
+
+# Adds a random tile (2 with 90% probability, 4 otherwise) in a random empty cell
+def add_random_tile(board, rng=random):
+    cells = empty_cells(board)
+    if not cells: return board
+
+    row, col = rng.choice(cells)
+    return set_cell(board, row, col, 1 if rng.random() < 0.9 else 2)
+
+# Returns the exponent of a tile value. Tiles above 2 ** MAX_EXPONENT do
+# not fit in a cell.
+def tile_exponent(tile):
+    exponent = int(tile).bit_length() - 1
+    if exponent > MAX_EXPONENT: raise ValueError(f"Tile {tile} is above the highest tile {1 << MAX_EXPONENT}")
+    return exponent
+
+# Converts a list of lists of tile values into a packed board
+def from_lists(lists):
+    board = 0
+
+    for i, row in enumerate(lists):
+        for j, tile in enumerate(row):
+            if tile:
+                board |= tile_exponent(tile) << (4 * (4 * i + j))
+
+    return board
+
+# Converts a packed board into a list of lists of tile values
+def to_lists(board):
+    lists = []
+
+    for i in range(4):
+        row = (board >> (16 * i)) & ROW_MASK
+        lists.append([1 << e if e else 0 for e in unpack_row(row)])
+
+    return lists
+
+# Returns the value of the highest tile
+def max_tile(board):
+    exponent = max_exponent(board)
+    return 1 << exponent if exponent else 0
@@ -0,0 +1,227 @@
+import random
+from . import bitboard
+from .gamelog import GameLog, SEED_MASK
+from .renderer import window_renderer
+
+DIRECTIONS_MAP = bitboard.DIRECTIONS_MAP
+
+class Board:
+    # Initializes the board, the state is kept packed in a 64-bit integer
+    # (see bitboard.py) and exposed read-only as rows of tile values through
+    # Board.board.
+    # Next to it the board tracks, across move and add_tile:
+    #   empty_mask: 16-bit mask of the empty cells, bit 4 * row + col
+    #   max_exponent: exponent of the highest tile
+    #   score: the score gained by the merges so far
+    # Its Zobrist hash (see bitboard.ZOBRIST) is computed on demand by the
+    # hash property.
+    # Tiles are spawned by the board's own RNG, seeded with seed (a random
+    # one if None), and every applied move is recorded in log (a GameLog),
+    # so the game can be replayed exactly (see automatic/replay.py).
+    # The game windows subclass WindowBoard, which adds the render method.
+    # The fields live in __slots__, a Board takes about 120 bytes (see the
+    # README for the breakdown) instead of the ~540 bytes of a __dict__ plus
+    # a list of four lists. Boards built with from_packed or with_tile, as
+    # search nodes are, create their RNG only if they spawn a tile.
+    __slots__ = ("packed", "score", "empty_mask", "max_exponent", "seed", "rng", "log")
+
+    def __init__(self, board=None, seed=None):
+        self.packed = 0
+        self.score = 0
+        self.rng = None
+        self.log = None
+        self._refresh()
+
+        if board == None:
+            self.reset(seed)
+        else:
+            self.board = board
+            self._seed(seed)
+            self.log = GameLog(self.seed, self.packed, from_reset=False)
+
+    # Builds a board directly from its packed representation
+    @classmethod
+    def from_packed(cls, packed, score=0):
+        board = cls.__new__(cls)
+        board.packed = packed
+        board.score = score
+        board.seed = None
+        board.rng = None
+        board.log = None
+        board._refresh()
+        return board
+
+    # Returns a new board with a tile of the given value placed in the
+    # (row, col) position, without copying the list view or rescanning cells
+    def with_tile(self, position, value):
+        child = type(self).__new__(type(self))
+        child.packed = self.packed
+        child.score = self.score
+        child.empty_mask = self.empty_mask
+        child.max_exponent = self.max_exponent
+        child.seed = None
+        child.rng = None
+        child.log = None
+        child._place(position[0] * 4 + position[1], bitboard.tile_exponent(value))
+        return child
+
+    # Read-only view of the packed state, a tuple of row tuples of tile
+    # values. It is rebuilt on every read, so it is immutable rather than a
+    # list of lists whose writes would be silently lost: change the board
+    # by assigning a whole list of lists to board, or with add_tile.
+    @property
+    def board(self):
+        return tuple(map(tuple, bitboard.to_lists(self.packed)))
+
+    @board.setter
+    def board(self, lists):
+        self.packed = bitboard.from_lists(lists)
+        self._refresh()
+
+    # Zobrist hash of the tiles
+    @property
+    def hash(self):
+        return bitboard.zobrist(self.packed)
+
+    # Returns the (row, col) positions of the empty cells
+    def empty_cells(self):
+        return [(i >> 2, i & 3) for i in bitboard.mask_indices(self.empty_mask)]
+
+    # Returns the value of the highest tile
+    def max_tile(self):
+        return 1 << self.max_exponent if self.max_exponent else 0
+
+    # Resets to the initial state, only two random tiles.
+    # The RNG is reseeded with seed, or with a new random seed if None.
+    def reset(self, seed=None):
+        self._seed(seed)
+        self.packed = 0
+        self.score = 0
+        self._refresh()
+
+        self.add_tile()
+        self.add_tile()
+
+        self.log = GameLog(self.seed, self.packed, from_reset=True)
+
+    # Adds the tile if one is given, generate a random one otherwise.
+    # Explicitly placed tiles cannot be replayed, they end the game log.
+    def add_tile(self, position = None, value = 0):
+        if position is not None and value > 0:
+            self._place(position[0] * 4 + position[1], bitboard.tile_exponent(value))
+            self.log = None
+            return
+
+        if self.rng is None: self._seed(None)
+
+        if self.empty_mask:
+            cell = self.rng.choice(bitboard.mask_indices(self.empty_mask))
+            self._place(cell, 1 if self.rng.random() < 0.9 else 2)
+
+    # Moves the tiles in the given direction,
+    # If apply_change is True, the board edit is applied to the board state and a new random tile is generated,
+    # Otherwise a board with the applied move is returned without updating the board state and without generating
+    # a new random tile
+    def move(self, direction, apply_change=True):
+        dir = bitboard.DIRECTIONS_INDEX[direction]
+        new_packed = bitboard.move(self.packed, dir)
+
+        if not apply_change: return bitboard.to_lists(new_packed)
+
+        if new_packed != self.packed:
+            self.score += bitboard.move_score(self.packed, dir)
+            self.packed = new_packed
+            self._refresh()
+            self.add_tile()
+
+            if self.log is not None: self.log.record(dir)
+
+    # Seeds the tile RNG. A missing seed is drawn from the global random
+    # module, so random.seed() still makes unseeded boards reproducible.
+    # Any int is taken, reduced to the 64 bits kept by the game log.
+    def _seed(self, seed):
+        self.seed = (seed if seed is not None else random.getrandbits(64)) & SEED_MASK
+        self.rng = random.Random(self.seed)
+
+    # Recomputes the tracked fields from the packed state with row table
+    # lookups, a move changes every row so this is its incremental update
+    def _refresh(self):
+        self.empty_mask = bitboard.empty_mask(self.packed)
+        self.max_exponent = bitboard.max_exponent(self.packed)
+
+    # Stores the exponent in the cell, updating the tracked fields in O(1)
+    def _place(self, cell, exponent):
+        shift = 4 * cell
+        old = (self.packed >> shift) & 0xF
+
+        self.packed = (self.packed & ~(0xF << shift)) | (exponent << shift)
+
+        if exponent: self.empty_mask &= ~(1 << cell)
+        else: self.empty_mask |= 1 << cell
+
+        if exponent > self.max_exponent: self.max_exponent = exponent
+        elif old == self.max_exponent and exponent < old: self.max_exponent = bitboard.max_exponent(self.packed)
+
+    # Returns the board in its canonical orientation (see bitboard.canonical)
+    # and the transform that produced it. A move chosen on the canonical
+    # board maps back with bitboard.invert_direction(direction, transform).
+    def canonical(self):
+        packed, transform = bitboard.canonical(self.packed)
+        return type(self).from_packed(packed, self.score), transform
+
+    # Returns the set of directions that would change the board
+    def legal_moves(self):
+        mask = bitboard.legal_moves(self.packed)
+        return {DIRECTIONS_MAP[dir] for dir in range(4) if mask >> dir & 1}
+
+    # Checks whether the current board status is a game over,
+    # that is, no direction would change the board
+    def is_game_over(self):
+        return bitboard.is_game_over(self.packed)
+
+# Board drawn in the game window of a front-end. The front-end subclasses it
+# with theme set to its globals module, which holds the colors and sizes of
+# the window.
+class WindowBoard(Board):
+    __slots__ = ()
+    theme = None
+    # Render cache of the subclass, created on its first render
+    renderer = None
+
+    # Draws the board with the render cache and returns the changed
+    # rectangles, to be pushed with pygame.display.update
+    def render(self, pygame, screen):
+        cls = type(self)
+        if cls.renderer is None: cls.renderer = window_renderer(pygame, cls.theme)
+
+        return cls.renderer.draw(screen, self.board, cls.theme.HEIGHT, cls.theme.SQUARE_SIZE)
+
+# Free list of Board objects for code that creates and discards many boards,
+# such as search nodes: release() keeps finished boards (up to max_size) and
+# acquire() reinitializes one of them instead of allocating a new Board.
+# board_class is the class of the new boards, e.g. a front-end's subclass.
+class BoardPool:
+    def __init__(self, max_size=1024, board_class=Board):
+        self.max_size = max_size
+        self.board_class = board_class
+        self.free = []
+
+    # Returns a board holding the packed state
+    def acquire(self, packed, score=0):
+        if not self.free: return self.board_class.from_packed(packed, score)
+
+        board = self.free.pop()
+        board.packed = packed
+        board.score = score
+        board.seed = None
+        board.rng = None
+        board.log = None
+        board._refresh()
+        return board
+
+    # Gives the board back to the pool, it must not be used afterwards
+    def release(self, board):
+        if len(self.free) < self.max_size: self.free.append(board)
+
+    def __len__(self):
+        return len(self.free)
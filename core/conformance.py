@@ -0,0 +1,249 @@
+import argparse
+import json
+import os
+import random
+import sys
+
+import numpy as np
+
+# Conformance corpus of the game rules.
+#
+# conformance.jsonl holds boards with the expected result of every move: the
+# moved board (before the tile spawn), the score gained, the legal moves and
+# whether the game is over. The expected results come from reference_move,
+# a plain list implementation of the rules written independently of the
+# lookup tables, and every implementation in the package is checked against
+# them: bitboard, batch and Board. Spawns are random, so they are checked by
+# their properties instead: one new 2 or 4, in a cell that was empty.
+#
+#   python3 core/conformance.py             checks the package
+#   python3 core/conformance.py --generate  rewrites the corpus
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from core import batch, bitboard
+from core.board import Board
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "conformance.jsonl")
+CORPUS_SEED = 2048
+RANDOM_CASES = 240
+
+# Highest tile, two of them do not merge (see bitboard.MAX_EXPONENT)
+MAX_TILE = 1 << bitboard.MAX_EXPONENT
+
+# Slides and merges a line towards index 0: every tile merges at most once,
+# with the first equal tile it meets. Returns the new line and the score.
+def reference_line(line):
+    tiles = [tile for tile in line if tile != 0]
+    result = []
+    score = 0
+
+    while tiles:
+        tile = tiles.pop(0)
+
+        if tiles and tiles[0] == tile and tile < MAX_TILE:
+            tiles.pop(0)
+            tile *= 2
+            score += tile
+
+        result.append(tile)
+
+    return result + [0] * (4 - len(result)), score
+
+# Moves a list of lists of tile values in the given direction (0: up,
+# 1: down, 2: left, 3: right), returns the moved board and the score
+def reference_move(values, direction):
+    moved = [[0] * 4 for _ in range(4)]
+    score = 0
+
+    for i in range(4):
+        # Cells of line i, ordered from the edge the tiles move towards
+        if direction == 0: cells = [(r, i) for r in range(4)]
+        elif direction == 1: cells = [(r, i) for r in range(3, -1, -1)]
+        elif direction == 2: cells = [(i, c) for c in range(4)]
+        else: cells = [(i, c) for c in range(3, -1, -1)]
+
+        line, gained = reference_line([values[r][c] for r, c in cells])
+        score += gained
+
+        for (r, c), tile in zip(cells, line): moved[r][c] = tile
+
+    return moved, score
+
+def reference_case(values):
+    moves = [reference_move(values, direction) for direction in range(4)]
+    legal = [moved != values for moved, _ in moves]
+
+    return {
+        "board": values,
+        "moves": [{"board": moved, "score": score} for moved, score in moves],
+        "legal": legal,
+        "game_over": not any(legal),
+    }
+
+# Hand-picked boards for the rules that random boards rarely hit: chains of
+# equal tiles, merges that must not cascade, the 32768 cap, full boards
+def edge_boards():
+    boards = [
+        [[0] * 4 for _ in range(4)],
+        [[2] * 4 for _ in range(4)],
+        [[2, 2, 2, 2], [4, 4, 2, 2], [2, 2, 4, 4], [2, 0, 2, 0]],
+        [[4, 2, 2, 0], [2, 2, 4, 0], [8, 0, 0, 8], [2, 4, 8, 16]],
+        [[2, 2, 4, 8], [0, 0, 0, 2], [2, 0, 0, 2], [4, 0, 4, 4]],
+        [[2, 4, 2, 4], [4, 2, 4, 2], [2, 4, 2, 4], [4, 2, 4, 2]],
+        [[2, 4, 2, 4], [4, 2, 4, 2], [2, 4, 2, 4], [4, 2, 4, 4]],
+        [[2, 4, 2, 4], [4, 2, 4, 2], [2, 4, 2, 4], [4, 2, 4, 0]],
+        [[MAX_TILE] * 4 for _ in range(4)],
+        [[MAX_TILE, MAX_TILE, 16384, 16384], [0] * 4, [0] * 4, [0] * 4],
+        [[MAX_TILE, 0, 0, 0], [MAX_TILE, 0, 0, 0], [2, 0, 0, 0], [2, 0, 0, 0]],
+        [[2, 4, 8, 16], [32, 64, 128, 256], [512, 1024, 2048, 4096], [8192, 16384, MAX_TILE, 2]],
+        [[0, 0, 0, 2], [0, 0, 2, 0], [0, 2, 0, 0], [2, 0, 0, 0]],
+        [[1024, 1024, 2048, 0], [0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 4096]],
+        [[2, 2, 2, 0], [0, 2, 2, 2], [2, 0, 2, 2], [2, 2, 0, 2]],
+        [[16, 8, 4, 2], [2, 4, 8, 16], [16, 8, 4, 2], [2, 4, 8, 16]],
+    ]
+
+    return boards
+
+# Random boards: any density, mostly small tiles with the odd large one
+def random_boards(rng, count):
+    boards = []
+
+    for _ in range(count):
+        density = rng.random()
+        boards.append([[1 << min(int(rng.expovariate(0.35)) + 1, bitboard.MAX_EXPONENT) if rng.random() < density else 0
+                        for _ in range(4)] for _ in range(4)])
+
+    return boards
+
+def generate(path):
+    boards = edge_boards() + random_boards(random.Random(CORPUS_SEED), RANDOM_CASES)
+
+    with open(path, "w") as f:
+        for values in boards:
+            f.write(json.dumps(reference_case(values)) + "\n")
+
+    return len(boards)
+
+def load(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+# Collects the failed checks, so a run reports all of them at once
+class Checker:
+    def __init__(self):
+        self.checks = 0
+        self.failures = []
+
+    def expect(self, condition, message):
+        self.checks += 1
+        if not condition: self.failures.append(message)
+
+def check_bitboard(cases, checker):
+    for i, case in enumerate(cases):
+        packed = bitboard.from_lists(case["board"])
+        legal = bitboard.legal_moves(packed)
+
+        for direction, expected in enumerate(case["moves"]):
+            checker.expect(bitboard.to_lists(bitboard.move(packed, direction)) == expected["board"], f"bitboard: case {i}, move {direction}")
+            checker.expect(bitboard.move_score(packed, direction) == expected["score"], f"bitboard: case {i}, score of move {direction}")
+            checker.expect(bool(legal >> direction & 1) == case["legal"][direction], f"bitboard: case {i}, legality of move {direction}")
+
+        checker.expect(bitboard.is_game_over(packed) == case["game_over"], f"bitboard: case {i}, game over")
+
+def check_batch(cases, checker):
+    boards = batch.from_values([case["board"] for case in cases])
+    legal = batch.legal_moves(boards)
+    game_over = batch.is_game_over(boards)
+
+    packed = batch.to_packed(boards)
+    checker.expect(np.array_equal(batch.from_packed(packed), boards), "batch: packed round trip")
+
+    for i, case in enumerate(cases):
+        checker.expect(int(packed[i]) == bitboard.from_lists(case["board"]), f"batch: case {i}, packed board")
+        checker.expect(legal[i].tolist() == case["legal"], f"batch: case {i}, legal moves")
+        checker.expect(bool(game_over[i]) == case["game_over"], f"batch: case {i}, game over")
+
+    for direction in range(4):
+        moved, gains, changed = batch.move(boards, direction)
+        values = batch.to_values(moved)
+
+        for i, case in enumerate(cases):
+            expected = case["moves"][direction]
+            checker.expect(values[i].tolist() == expected["board"], f"batch: case {i}, move {direction}")
+            checker.expect(int(gains[i]) == expected["score"], f"batch: case {i}, score of move {direction}")
+            checker.expect(bool(changed[i]) == case["legal"][direction], f"batch: case {i}, change of move {direction}")
+
+    directions = np.arange(len(cases)) % 4
+    moved, gains, changed = batch.move_each(boards, directions)
+    values = batch.to_values(moved)
+
+    for i, case in enumerate(cases):
+        expected = case["moves"][directions[i]]
+        checker.expect(values[i].tolist() == expected["board"] and int(gains[i]) == expected["score"], f"batch: case {i}, move_each")
+
+def check_board(cases, checker):
+    for i, case in enumerate(cases):
+        board = Board(case["board"], seed=i)
+
+        checker.expect(board.legal_moves() == {bitboard.DIRECTIONS_MAP[d] for d in range(4) if case["legal"][d]}, f"Board: case {i}, legal moves")
+        checker.expect(board.is_game_over() == case["game_over"], f"Board: case {i}, game over")
+
+        for direction, expected in enumerate(case["moves"]):
+            name = bitboard.DIRECTIONS_MAP[direction]
+            checker.expect(board.move(name, apply_change=False) == expected["board"], f"Board: case {i}, move {direction}")
+
+            played = Board(case["board"], seed=i)
+            played.move(name)
+
+            if case["legal"][direction]:
+                checker.expect(played.score == expected["score"], f"Board: case {i}, score of move {direction}")
+                checker.expect(is_spawn(expected["board"], played.board), f"Board: case {i}, spawn after move {direction}")
+            else:
+                checker.expect(played.score == 0 and played.board == tuple(map(tuple, case["board"])), f"Board: case {i}, illegal move {direction} changed the board")
+
+# True if after differs from before by exactly one new 2 or 4 in an empty cell
+def is_spawn(before, after):
+    changes = [(b, a) for row_b, row_a in zip(before, after) for b, a in zip(row_b, row_a) if b != a]
+    return len(changes) == 1 and changes[0][0] == 0 and changes[0][1] in (2, 4)
+
+def check_spawns(cases, checker):
+    rng = random.Random(CORPUS_SEED)
+    np_rng = np.random.default_rng(CORPUS_SEED)
+
+    for i, case in enumerate(cases):
+        full = all(all(row) for row in case["board"])
+        spawned = bitboard.to_lists(bitboard.add_random_tile(bitboard.from_lists(case["board"]), rng))
+        checker.expect(spawned == case["board"] if full else is_spawn(case["board"], spawned), f"bitboard: case {i}, spawn")
+
+    boards = batch.from_values([case["board"] for case in cases])
+    spawned = batch.to_values(batch.add_random_tiles(boards.copy(), np_rng))
+
+    for i, case in enumerate(cases):
+        full = all(all(row) for row in case["board"])
+        checker.expect(spawned[i].tolist() == case["board"] if full else is_spawn(case["board"], spawned[i].tolist()), f"batch: case {i}, spawn")
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks every implementation of the 2048 rules against the conformance corpus")
+    parser.add_argument("--corpus", default=CORPUS_FILE, help="corpus file (JSON lines)")
+    parser.add_argument("--generate", action="store_true", help="rewrite the corpus from the reference implementation")
+    args = parser.parse_args()
+
+    if args.generate:
+        print(f"Wrote {generate(args.corpus)} cases to {args.corpus}")
+        return
+
+    cases = load(args.corpus)
+    checker = Checker()
+
+    check_bitboard(cases, checker)
+    check_batch(cases, checker)
+    check_board(cases, checker)
+    check_spawns(cases, checker)
+
+    for message in checker.failures: print("FAIL " + message)
+    print(f"{len(cases)} cases, {checker.checks} checks, {len(checker.failures)} failed")
+
+    if checker.failures: sys.exit(1)
+
+if __name__ == '__main__':
+    main()
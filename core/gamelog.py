@@ -0,0 +1,76 @@
+import struct
+
+# Compact binary log of a game: the seed of the board RNG, the initial
+# position and the sequence of moves. Every tile spawn comes from the seeded
+# RNG, so the moves are enough to rebuild any position of the game (see
+# replay.py).
+#
+# File layout (little endian):
+#   header, 32 bytes: magic, flags (u8), 3 reserved bytes, number of moves
+#     (u32), seed (u64), initial packed board (u64)
+#   moves: 2 bits per move (0: up, 1: down, 2: left, 3: right), four moves
+#     per byte, the first move in the lowest bits
+#
+# A 1000-move game takes 282 bytes.
+
+MAGIC = b"2048LOG1"
+HEADER = struct.Struct("<8sB3xIQQ")
+
+# The seed is stored in 64 bits, Board reduces its seeds to this range so
+# that the logged seed is the one its RNG was seeded with
+SEED_MASK = (1 << 64) - 1
+
+# The initial position was produced by Board.reset with the seeded RNG,
+# otherwise the RNG was seeded after the initial position was set
+FLAG_RESET = 1
+
+class GameLog:
+    def __init__(self, seed, initial, from_reset=True, moves=None):
+        self.seed = seed
+        self.initial = initial
+        self.from_reset = from_reset
+        self.moves = moves if moves is not None else []
+
+    # Appends an applied move (direction index)
+    def record(self, direction):
+        self.moves.append(direction)
+
+    def to_bytes(self):
+        flags = FLAG_RESET if self.from_reset else 0
+        data = bytearray(HEADER.pack(MAGIC, flags, len(self.moves), self.seed, self.initial))
+
+        for i in range(0, len(self.moves), 4):
+            byte = 0
+            for j, direction in enumerate(self.moves[i:i+4]):
+                byte |= direction << (2 * j)
+            data.append(byte)
+
+        return bytes(data)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if len(data) < HEADER.size:
+            raise ValueError("Truncated game log")
+
+        magic, flags, count, seed, initial = HEADER.unpack_from(data, 0)
+
+        if magic != MAGIC:
+            raise ValueError("Not a game log")
+
+        if len(data) < HEADER.size + (count + 3) // 4:
+            raise ValueError("Truncated game log")
+
+        moves = [(data[HEADER.size + i // 4] >> (2 * (i % 4))) & 3 for i in range(count)]
+        return cls(seed, initial, bool(flags & FLAG_RESET), moves)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+    def __len__(self):
+        return len(self.moves)
@@ -0,0 +1,110 @@
+# Draws a 4x4 board of tile values with cached surfaces.
+#
+# Fonts are created once per size and every tile value is rendered once,
+# text included, into its own surface; drawing a tile is then a single blit.
+# The renderer remembers what it drew on the screen and only redraws the
+# cells that changed since the previous call, draw() returns their
+# rectangles so that only those are pushed with pygame.display.update.
+#
+# The layout is the one of the game window: the board square at 20 pixels
+# from the left and bottom edges, 100 pixel tiles every 110 pixels.
+
+TILE_SIZE = 100
+TILE_STEP = 110
+
+# Font size based on the number of digits
+def window_font_size(tile):
+    return 75 - 10 * (len(str(tile)) - 1)
+
+# Text centered in the 110 pixel cell of the tile
+def window_text_position(tile, text):
+    return ((TILE_STEP - text.get_width()) / 2, (TILE_STEP - text.get_height()) / 2)
+
+# Renderer of the game window of the manual game and the bot, with the
+# colors of the front-end's globals module
+def window_renderer(pygame, theme):
+    return BoardRenderer(pygame, theme.TILE_COLORS, theme.EMPTY_SQUARE_COLOR, theme.MAIN_SQUARE_COLOR,
+                         theme.DARK_TEXT_COLOR, theme.LIGHT_TEXT_COLOR, window_font_size, window_text_position)
+
+class BoardRenderer:
+    # pygame: the pygame module, passed in like in Board.render
+    # tile_colors: background color of every tile value
+    # font_size(value): font size of the text of a tile
+    # text_position(value, text): top left corner of the rendered text
+    #   surface inside the tile
+    def __init__(self, pygame, tile_colors, empty_color, board_color, dark_text_color, light_text_color, font_size, text_position):
+        self.pygame = pygame
+        self.tile_colors = tile_colors
+        self.empty_color = empty_color
+        self.board_color = board_color
+        self.dark_text_color = dark_text_color
+        self.light_text_color = light_text_color
+        self.font_size = font_size
+        self.text_position = text_position
+
+        self.fonts = {}
+        self.tiles = {}
+
+        # Screen and cell values of the last draw, None forces a full redraw
+        self.screen = None
+        self.drawn = None
+
+    def font(self, size):
+        if size not in self.fonts:
+            self.fonts[size] = self.pygame.font.Font(None, size)
+
+        return self.fonts[size]
+
+    # Surface of a tile value, 0 is the empty cell
+    def tile(self, value):
+        if value in self.tiles: return self.tiles[value]
+
+        pygame = self.pygame
+        surface = pygame.Surface((TILE_SIZE, TILE_SIZE))
+
+        if value == 0:
+            surface.fill(pygame.Color(self.empty_color))
+        else:
+            surface.fill(pygame.Color(self.tile_colors[value]))
+
+            color = self.dark_text_color if value < 8 else self.light_text_color
+            text = self.font(self.font_size(value)).render(str(value), True, pygame.Color(color))
+            surface.blit(text, self.text_position(value, text))
+
+        if pygame.display.get_surface() is not None: surface = surface.convert()
+
+        self.tiles[value] = surface
+        return surface
+
+    # Forgets what is on the screen, the next draw redraws the whole board
+    def invalidate(self):
+        self.drawn = None
+
+    # Draws the board (a list of four lists of tile values) and returns the
+    # list of rectangles that changed, empty if nothing did
+    def draw(self, screen, board, height, square_size):
+        pygame = self.pygame
+        top = height - 5 - square_size
+        dirty = []
+        full = screen is not self.screen or self.drawn is None
+
+        if full:
+            self.screen = screen
+            self.drawn = [[None] * 4 for _ in range(4)]
+
+            board_rect = pygame.Rect(20, height - 20 - square_size, square_size, square_size)
+            pygame.draw.rect(screen, pygame.Color(self.board_color), board_rect)
+            dirty.append(board_rect)
+
+        for i, row in enumerate(board):
+            drawn = self.drawn[i]
+
+            for j, value in enumerate(row):
+                if drawn[j] == value: continue
+
+                drawn[j] = value
+                rect = screen.blit(self.tile(value), (35 + j * TILE_STEP, top + i * TILE_STEP))
+                # A full redraw already covers the whole board
+                if not full: dirty.append(rect)
+
+        return dirty
@@ -3,5 +3,6 @@ import gymnasium as gym
 gym.register(
     id='Game2048-v0',
     entry_point='gymcustomenv:Env2048',
+    vector_entry_point='gymcustomenv:Env2048Vector',
     kwargs={}
 )
\ No newline at end of file
@@ -1,9 +1,17 @@
+import os
+import sys
 import random
 import pygame
-import math
 import numpy as np
 import gymnasium as gym
 from gymnasium import spaces
+from gymnasium.vector import VectorEnv, AutoresetMode
+from gymnasium.vector.utils import batch_space
+
+# The environment only imports the shared rules here, from ../core
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from core import batch, bitboard
+from core.renderer import BoardRenderer
 
 background_color = "#FAF8EF"
 main_square_border_color = "#BBADA0"
@@ -36,184 +44,212 @@ HEURISTICS = [[2**16,2**15,2**14,2**13],
               [2**8, 2**7, 2**6, 2**5],
               [2,   2**2, 2**3, 2**4]]
 
-def generate_random_tile(board):
-    x = random.randint(0, 3)
-    y = random.randint(0, 3)
-
-    while board[x][y] != 0:
-        x = random.randint(0, 3)
-        y = random.randint(0, 3)
-    
-    num = 2 if random.random() < 0.9 else 4
-    board[x][y] = num
-
-    return board
-
-def slide(board, action):
-    cols = [[board[i][j] for i in range(4)] for j in range(4)]
-
-    new_cols = []
-    new_rows = []
-
-    new_board = []
-
-    if action == 0:
-        for col in cols:
-            non_zero_tiles = [tile for tile in col if tile != 0]
-            new_col = non_zero_tiles + [0] * (4 - len(non_zero_tiles))
-            new_cols.append(new_col)
-
-        new_board = [[new_cols[i][j] for i in range(4)] for j in range(4)]
-    
-    elif action == 1:
-        for col in cols:
-            non_zero_tiles = [tile for tile in col if tile != 0]
-            new_col = [0] * (4 - len(non_zero_tiles)) + non_zero_tiles
-            new_cols.append(new_col)
-
-        new_board = [[new_cols[i][j] for i in range(4)] for j in range(4)]
-
-    elif action == 2:
-        for row in board:
-            non_zero_tiles = [tile for tile in row if tile != 0]
-            new_row = non_zero_tiles + [0] * (4 - len(non_zero_tiles))
-            new_rows.append(new_row)
-
-        new_board = new_rows
-
-    elif action == 3:
-        for row in board:
-            non_zero_tiles = [tile for tile in row if tile != 0]
-            new_row = [0] * (4 - len(non_zero_tiles)) + non_zero_tiles
-            new_rows.append(new_row)
-
-        new_board = new_rows
-    
-    return new_board
-
-def compress(board, action):
-    new_board = [[board[j][i] for i in range(4)] for j in range(4)]
-    score_increment = 0
-
-    if action == 0:
-        for i in range(4):
-            for j in range(3):
-                if new_board[j][i] == new_board[j+1][i]:
-                    new_board[j][i] *= 2
-                    score_increment += new_board[j][i]
-                    new_board[j+1][i] = 0
-
-    elif action == 1:
-        for i in range(4):
-            for j in range(3, 0, -1):
-                if new_board[j][i] == new_board[j-1][i]:
-                    new_board[j][i] *= 2
-                    score_increment += new_board[j][i]
-                    new_board[j-1][i] = 0
-
-    elif action == 2:
-        for i in range(4):
-            for j in range(3):
-                if new_board[i][j] == new_board[i][j+1]:
-                    new_board[i][j] *= 2
-                    score_increment += new_board[i][j]
-                    new_board[i][j+1] = 0
-
-    elif action == 3:
-        for i in range(4):
-            for j in range(3, 0, -1):
-                if new_board[i][j] == new_board[i][j-1]:
-                    new_board[i][j] *= 2
-                    score_increment += new_board[i][j]
-                    new_board[i][j-1] = 0
-
-    return score_increment, new_board
-
-def move(board, action):
-    new_board = [[board[j][i] for i in range(4)] for j in range(4)]
-
-    new_board = slide(new_board, action)
-    score_increment, new_board = compress(new_board, action)
-    new_board = slide(new_board, action)
-
-    if board != new_board:
-        new_board = generate_random_tile(new_board)
-    
-    return score_increment, new_board
-
+# Reward weights, computed once instead of on every step
+LOG_HEURISTICS = np.log(np.array(HEURISTICS, dtype=np.float64))
+
+# CELL_REWARDS[cell][exponent]: reward of the tile in cell 4 * row + col, the
+# tile value times its weight, so Env2048 sums 16 lookups per step
+CELL_REWARDS = [[float((1 << e if e else 0) * LOG_HEURISTICS[cell // 4, cell % 4]) for e in range(16)] for cell in range(16)]
+
+# Exponent of the 2048 tile, reaching it wins the game
+WIN_EXPONENT = 11
+
+# Highest exponent the engine can produce, 32768 tiles are never merged
+MAX_EXPONENT = 15
+
+# Observation modes of the environments (obs_mode):
+#   values: tile values, a list of lists (Env2048) or int64 (N, 4, 4) array
+#   log2: uint8 (4, 4) exponents, 0 for an empty cell, 8x smaller than the
+#     int64 values; the engine's own board array, returned without a copy
+#   onehot: uint8 (16, 4, 4) planes, plane e marks the cells holding
+#     exponent e, ready for a convolutional network
+#   packed: uint64 board, cell (r, c) in bits 4 * (4r + c) as in
+#     core/bitboard.py, 16x smaller than the values; a view of the packed rows
+OBS_MODES = ("values", "log2", "onehot", "packed")
+
+def observation_space(obs_mode):
+    if obs_mode == "values":
+        return spaces.Box(0, 2 ** MAX_EXPONENT, shape=(4, 4), dtype=np.int64)
+    if obs_mode == "log2":
+        return spaces.Box(0, MAX_EXPONENT, shape=(4, 4), dtype=np.uint8)
+    if obs_mode == "onehot":
+        return spaces.Box(0, 1, shape=(16, 4, 4), dtype=np.uint8)
+    if obs_mode == "packed":
+        return spaces.Box(0, np.iinfo(np.uint64).max, shape=(), dtype=np.uint64)
+
+    raise ValueError(f"Unknown observation mode: {obs_mode}, available: {', '.join(OBS_MODES)}")
+
+# Observations of an (N, 4, 4) batch of exponents. out is the preallocated
+# buffer of the values (int64) and onehot (bool) modes.
+def observe(boards, obs_mode, out=None):
+    if obs_mode == "values": return batch.to_values(boards, out=out)
+    if obs_mode == "log2": return boards
+    if obs_mode == "onehot": return batch.to_onehot(boards, out=out)
+    return batch.to_packed(boards)
+
+# Render cache of draw_state, created on the first draw
+_renderer = None
+
+# Draws the board with cached tile surfaces, only the cells that changed
+# since the last call are redrawn. Returns the changed rectangles.
 def draw_state(pygame, screen, state, height, square_size):
-    pygame.draw.rect(screen, pygame.Color(main_square_border_color), pygame.Rect(20, height-20-square_size, square_size, square_size))
-
-    for i, row in enumerate(state):
-        for j, tile in enumerate(row):
-            if tile != 0:
-                pygame.draw.rect(screen, pygame.Color(tile_colors[tile]), pygame.Rect(35 + j * 110, height - 5 - square_size + i * 110, 100, 100))
-
-                font = pygame.font.Font(None, 75)
-                text = font.render(str(tile), True, pygame.Color(dark_text_color if tile < 8 else light_text_color))
+    global _renderer
 
-                text_x = 35 + j * 110 + 35
-                text_y = height - 5 - square_size + i * 110 + 30
+    if _renderer is None:
+        _renderer = BoardRenderer(pygame, tile_colors, empty_square_color, main_square_border_color, dark_text_color, light_text_color,
+                                  lambda tile: 75, lambda tile, text: (35, 30))
 
-                screen.blit(text, (text_x, text_y))
-            else:
-                pygame.draw.rect(screen, pygame.Color(empty_square_color), pygame.Rect(35 + j * 110, height - 5 - square_size + i * 110, 100, 100))
+    return _renderer.draw(screen, state, height, square_size)
 
 class Env2048(gym.Env):
     metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 60}
 
-    def __init__(self, render_mode=None):
+    def __init__(self, render_mode=None, obs_mode="values"):
         self.score = 0
         self.window_size = 512
         self.square_size = self.window_size - 40
         self.render_mode = render_mode
+        self.obs_mode = obs_mode
 
-        self.observation_space = spaces.Box(0, 2048, shape=(4, 4), dtype=int)
+        self.observation_space = observation_space(obs_mode)
         self.action_space = spaces.Discrete(4)
 
         if render_mode == None: return
 
         pygame.init()
         self.screen = pygame.display.set_mode((self.window_size, self.window_size))
+        self.screen.fill(pygame.Color(background_color))
+        pygame.display.flip()
         self.clock = pygame.time.Clock()
 
-    def reset(self):
+    # The board is kept as a packed 64-bit board of core.bitboard, moved with
+    # its lookup tables. Tiles are spawned by a Python RNG seeded from
+    # np_random, so seeding reset() still makes the episodes reproducible.
+    def reset(self, seed=None, options=None):
+        super().reset(seed=seed)
+
         self.score = 0
-        board = [[0] * 4 for _ in range(4)]
+        self.rng = random.Random(int(self.np_random.integers(2 ** 63)))
+        self.packed = bitboard.add_random_tile(bitboard.add_random_tile(0, self.rng), self.rng)
+
+        return self._observation(), {"score": self.score}
 
-        board = generate_random_tile(board)
-        board = generate_random_tile(board)
+    # Tile values as a list of lists
+    @property
+    def state(self):
+        return bitboard.to_lists(self.packed)
+
+    # The observation in the selected mode, only the values mode builds lists
+    def _observation(self):
+        if self.obs_mode == "values": return self.state
+        if self.obs_mode == "packed": return np.array(self.packed, dtype=np.uint64)
+
+        boards = batch.from_packed(np.array([self.packed], dtype=np.uint64))
+        return observe(boards, self.obs_mode)[0, ...]
 
-        self.state = board
-        return self.state
-    
     def step(self, action):
-        score_increment, next_state = move(self.state, action)
-        self.score += score_increment
+        packed = self.packed
+        moved = bitboard.move(packed, action)
 
-        self.state = next_state
-        won = any(2048 in row for row in next_state)
-        lose = all(0 not in row for row in next_state)
+        if moved != packed:
+            self.score += bitboard.move_score(packed, action)
+            moved = bitboard.add_random_tile(moved, self.rng)
 
-        goodness_score = 0
-        for i in range(4):
-            for j in range(4):
-                goodness_score += self.state[j][i] * math.log(HEURISTICS[j][i])
+        self.packed = moved
+        won = bitboard.max_exponent(moved) >= WIN_EXPONENT
+        lose = bitboard.empty_mask(moved) == 0
 
-        reward = -100.0 if lose else goodness_score
+        if lose:
+            reward = -100.0
+        else:
+            reward = 0.0
+            for cell in range(16):
+                reward += CELL_REWARDS[cell][(moved >> (4 * cell)) & 0xF]
 
         if won: print("Won!")
 
         done = won or lose
 
         if done:
-            print("Highest tile: ", np.max(self.state))
+            print("Highest tile: ", bitboard.max_tile(moved))
 
-        return next_state, reward, done, done, {"score": self.score}
+        return self._observation(), reward, done, done, {"score": self.score}
 
     def render(self):
         if self.render_mode == None: return
 
-        self.screen.fill(pygame.Color(background_color))
-        draw_state(pygame, self.screen, self.state, self.window_size, self.square_size)
-        pygame.display.update()
+        dirty = draw_state(pygame, self.screen, self.state, self.window_size, self.square_size)
+        if dirty: pygame.display.update(dirty)
+
+# Vectorized version of Env2048: steps num_envs boards per call with the
+# batch engine. Finished boards are reset in the same step (the returned
+# observation is already the new board), their last observation and score
+# are reported in info["final_obs"] and info["final_score"] for the boards
+# selected by info["_final"]. The returned arrays are preallocated buffers
+# that are overwritten by the next call.
+class Env2048Vector(VectorEnv):
+    metadata = {"render_modes": [], "autoreset_mode": AutoresetMode.SAME_STEP}
+
+    def __init__(self, num_envs=16, render_mode=None, obs_mode="values"):
+        self.num_envs = num_envs
+        self.render_mode = render_mode
+        self.obs_mode = obs_mode
+
+        self.single_observation_space = observation_space(obs_mode)
+        self.single_action_space = spaces.Discrete(4)
+        self.observation_space = batch_space(self.single_observation_space, num_envs)
+        self.action_space = batch_space(self.single_action_space, num_envs)
+
+        self.boards = batch.empty(num_envs)
+        self.scores = np.zeros(num_envs, dtype=np.int64)
+
+        # Tile values, used for the rewards and as the values observations
+        self._values = np.zeros((num_envs, 4, 4), dtype=np.int64)
+        self._onehot = np.zeros((num_envs, 16, 4, 4), dtype=bool) if obs_mode == "onehot" else None
+        self._final_observations = np.zeros((num_envs, *self.single_observation_space.shape), dtype=self.single_observation_space.dtype)
+        self._final_scores = np.zeros(num_envs, dtype=np.int64)
+        self._rewards = np.zeros(num_envs, dtype=np.float64)
+        self._truncations = np.zeros(num_envs, dtype=bool)
+
+    def reset(self, *, seed=None, options=None):
+        super().reset(seed=seed)
+
+        self.boards = batch.reset(self.num_envs, self.np_random)
+        self.scores[:] = 0
+
+        batch.to_values(self.boards, out=self._values)
+        return self._observe(), {"score": self.scores}
+
+    def _observe(self):
+        if self.obs_mode == "values": return self._values
+        return observe(self.boards, self.obs_mode, out=self._onehot)
+
+    def step(self, actions):
+        boards, gains, changed = batch.move_each(self.boards, np.asarray(actions))
+        batch.add_random_tiles(boards, self.np_random, changed)
+        self.boards = boards
+        self.scores += gains
+
+        batch.to_values(boards, out=self._values)
+        observations = self._observe()
+
+        won = (boards >= WIN_EXPONENT).any(axis=(1, 2))
+        lose = ~(boards == 0).any(axis=(1, 2))
+        done = won | lose
+
+        np.einsum("nij,ij->n", self._values, LOG_HEURISTICS, out=self._rewards)
+        self._rewards[lose] = -100.0
+
+        info = {"score": self.scores}
+
+        if done.any():
+            self._final_observations[done] = observations[done]
+            self._final_scores[done] = self.scores[done]
+            info.update({"final_obs": self._final_observations, "final_score": self._final_scores, "_final": done})
+
+            batch.reset_where(self.boards, done, self.np_random)
+            self.scores[done] = 0
+            self._values[done] = batch.to_values(self.boards[done])
+            observations = self._observe()
+
+        return observations, self._rewards, done, self._truncations, info
@@ -1,22 +1,27 @@
 import math
+import json
+import time
+import argparse
 import pygame
 import random
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.optim as optim
 import torch.nn.functional as F
 import gymnasium as gym
 import envregister
+from replaybuffer import ReplayBuffer, PrioritizedReplayBuffer
 import matplotlib
 import matplotlib.pyplot as plt
-from collections import namedtuple, deque
 from itertools import count
 
-from collections import namedtuple, deque
-from itertools import count
+# Observation mode of the environments (see gymcustomenv.OBS_MODES), the
+# network takes the values, log2 and onehot modes
+OBS_MODE = "values"
 
-env = gym.make('Game2048-v0')
-state = env.reset()
+env = gym.make('Game2048-v0', obs_mode=OBS_MODE)
+state, info = env.reset()
 
 is_ipython = 'inline' in matplotlib.get_backend()
 if is_ipython:
@@ -32,26 +37,43 @@ EPS_DECAY = 1000
 TAU = 0.005
 LR = 1e-3
 
-device = torch.device("mps")
-
-Transition = namedtuple('Transition', ('state', 'action', 'next_state', 'reward'))
+MEMORY_CAPACITY = 1000
+# Prioritized experience replay (see replaybuffer.py) instead of uniform
+# sampling
+PRIORITIZED = False
+
+# Batched training (--batched): transitions are collected from NUM_ENVS
+# environments stepped together, with one optimizer step per vector step,
+# and the metrics are appended to METRICS_FILE every LOG_EVERY steps
+NUM_ENVS = 16
+TRAIN_STEPS = 20000
+BATCHED_MEMORY_CAPACITY = 100000
+LOG_EVERY = 100
+METRICS_FILE = "metrics.jsonl"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Trains a DQN agent on 2048")
+    parser.add_argument("--batched", action="store_true", help="train on a vector of environments and log the metrics to a file instead of plotting")
+    parser.add_argument("--num-envs", type=int, default=NUM_ENVS)
+    parser.add_argument("--steps", type=int, default=TRAIN_STEPS, help="vector steps of the batched training")
+    parser.add_argument("--metrics", default=METRICS_FILE, help="JSON lines metrics file of the batched training")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args()
+
+# CUDA or Apple MPS when available, the CPU otherwise
+def pick_device():
+    if torch.cuda.is_available():
+        return torch.device("cuda")
+    if torch.backends.mps.is_available():
+        return torch.device("mps")
+    return torch.device("cpu")
+
+args = parse_args()
+device = pick_device()
 
 episode_durations = []
 episode_scores = []
 
-class ReplayMemory(object):
-    def __init__(self, capacity):
-        self.memory = deque([], maxlen=capacity)
-    
-    def push(self, *args):
-        self.memory.append(Transition(*args))
-    
-    def sample(self, batch_size):
-        return random.sample(self.memory, batch_size)
-    
-    def __len__(self):
-        return len(self.memory)
-
 class DQN(nn.Module):
     def __init__(self, n_inputs=16, n_actions=4):
         super(DQN, self).__init__()
@@ -60,7 +82,7 @@ class DQN(nn.Module):
         self.layer3 = nn.Linear(32, n_actions)
     
     def forward(self, x):
-        x = x.view(x.shape[0], -1)
+        x = x.reshape(x.shape[0], -1).float()
         x = F.relu(self.layer1(x))
         x = F.relu(self.layer2(x))
         x = self.layer3(x)
@@ -81,26 +103,35 @@ def select_action(state):
 def optimize_model():
     if len(memory) < BATCH_SIZE:
         return
-    transitions = memory.sample(BATCH_SIZE)
-    batch = Transition(*zip(*transitions))
-
-    non_final_mask = torch.tensor(tuple(map(lambda s: s is not None, batch.next_state)), device=device, dtype=torch.bool)
-    non_final_next_states = torch.cat([s for s in batch.next_state if s is not None])
+    batch = memory.sample(BATCH_SIZE)
 
-    state_batch = torch.cat(batch.state).to(device)
-    action_batch = torch.tensor(batch.action).to(device)
-    reward_batch = torch.cat(batch.reward).to(device)
+    # The batch arrays are contiguous, from_numpy shares their memory
+    state_batch = torch.from_numpy(batch.states).to(device)
+    action_batch = torch.from_numpy(batch.actions).to(device)
+    reward_batch = torch.from_numpy(batch.rewards).to(device)
+    next_state_batch = torch.from_numpy(batch.next_states).to(device)
+    non_final_mask = torch.from_numpy(~batch.dones).to(device)
 
     state_action_values = policy_net(state_batch).gather(1, action_batch.view(-1, 1))
 
-    next_state_values = torch.zeros(BATCH_SIZE, device=device)
+    # Final states have no next value
     with torch.no_grad():
-        next_state_values[non_final_mask] = target_net(non_final_next_states).max(1)[0]
+        next_state_values = target_net(next_state_batch).max(1)[0] * non_final_mask
     
     expected_state_action_values = (next_state_values * GAMMA) + reward_batch
 
-    criterion = nn.SmoothL1Loss()
-    loss = criterion(state_action_values, expected_state_action_values.unsqueeze(1))
+    if batch.weights is None:
+        criterion = nn.SmoothL1Loss()
+        loss = criterion(state_action_values, expected_state_action_values.unsqueeze(1))
+    else:
+        # Importance-sampling weighted loss, the TD errors become the new
+        # priorities of the sampled transitions
+        criterion = nn.SmoothL1Loss(reduction='none')
+        losses = criterion(state_action_values, expected_state_action_values.unsqueeze(1)).squeeze(1)
+        loss = (losses * torch.from_numpy(batch.weights).to(device)).mean()
+
+        td_errors = (state_action_values.squeeze(1) - expected_state_action_values).detach()
+        memory.update_priorities(batch.indices, td_errors.cpu().numpy())
 
     optimizer.zero_grad()
     loss.backward()
@@ -108,6 +139,28 @@ def optimize_model():
     torch.nn.utils.clip_grad_value_(policy_net.parameters(), 100)
     optimizer.step()
 
+    # Kept on the device, reading it would wait for the GPU every step
+    return loss.detach()
+
+# Soft update of the target network's weights, θ′ ← τ θ + (1 −τ )θ′, as one
+# fused in-place lerp over all the parameters
+def soft_update():
+    with torch.no_grad():
+        torch._foreach_lerp_(target_params, policy_params, TAU)
+
+# Epsilon-greedy actions for a batch of states, one forward pass for all
+def select_actions(states):
+    global steps_done
+    eps_threshold = EPS_END + (EPS_START - EPS_END) * \
+        math.exp(-1. * steps_done / EPS_DECAY)
+    steps_done += len(states)
+
+    with torch.no_grad():
+        greedy = policy_net(torch.from_numpy(states).to(device)).argmax(1).cpu().numpy()
+
+    explore = rng.random(len(states)) < eps_threshold
+    return np.where(explore, rng.integers(0, 4, size=len(states)), greedy), eps_threshold
+
 def plot_durations(show_result=False):
     plt.figure(1)
     durations_t = torch.tensor(episode_durations, dtype=torch.float)
@@ -150,21 +203,16 @@ def train():
 
     for i_episode in range(num_episodes):
         print(f"EPISODE {i_episode}/{num_episodes}")
-        state = env.reset()
-        state = torch.tensor(state, dtype=torch.float32, device=device).unsqueeze(0)
+        state, info = env.reset()
+        state = np.asarray(state, dtype=np.float32)
 
         for t in count():
-            action = select_action(state)
+            action = select_action(torch.from_numpy(state).unsqueeze(0).to(device))
             observation, reward, terminated, _, info = env.step(action.item())
-            reward = torch.tensor([reward], dtype=torch.float32, device=device)
-
-            if terminated:
-                next_state = None
-            else:
-                next_state = torch.tensor(observation, dtype=torch.float32, device=device).unsqueeze(0)
+            next_state = np.asarray(observation, dtype=np.float32)
 
             # Store the transition in memory
-            memory.push(state, action, next_state, reward)
+            memory.push(state, action.item(), reward, next_state, terminated)
 
             # Move to the next state
             state = next_state
@@ -172,13 +220,7 @@ def train():
             # Perform one step of the optimization (on the policy network)
             optimize_model()
 
-            # Soft update of the target network's weights
-            # θ′ ← τ θ + (1 −τ )θ′
-            target_net_state_dict = target_net.state_dict()
-            policy_net_state_dict = policy_net.state_dict()
-            for key in policy_net_state_dict:
-                target_net_state_dict[key] = policy_net_state_dict[key]*TAU + target_net_state_dict[key]*(1-TAU)
-            target_net.load_state_dict(target_net_state_dict)
+            soft_update()
 
             if terminated:
                 episode_durations.append(t + 1)
@@ -191,27 +233,99 @@ def train():
     plt.ioff()
     plt.show()
 
-policy_net = DQN().to(device)
-target_net = DQN().to(device)
+# Trains on num_envs environments stepped together: every vector step adds
+# num_envs transitions to the memory and is followed by one optimizer step
+# and one target update. Metrics are averaged over LOG_EVERY steps and
+# appended to metrics_path as JSON lines.
+def train_batched(num_envs, steps, metrics_path, seed=None):
+    envs = gym.make_vec('Game2048-v0', num_envs=num_envs, vectorization_mode='vector_entry_point', obs_mode=OBS_MODE)
+    observations, _ = envs.reset(seed=seed)
+    states = observations.astype(np.float32)
+
+    print(f"Training on {device} with {num_envs} environments...")
+
+    scores = []
+    losses = []
+    start = time.perf_counter()
+
+    with open(metrics_path, "w") as metrics:
+        for step in range(1, steps + 1):
+            actions, eps_threshold = select_actions(states)
+            observations, rewards, terminated, truncated, info = envs.step(actions)
+            next_states = observations.astype(np.float32)
+
+            # Finished boards are already reset in the observation, the
+            # transition ends on their last board
+            stored_next_states = next_states
+            if "_final" in info:
+                final = info["_final"]
+                stored_next_states = next_states.copy()
+                stored_next_states[final] = info["final_obs"][final]
+                scores.extend(info["final_score"][final].tolist())
+
+            memory.push_batch(states, actions, rewards, stored_next_states, terminated)
+            states = next_states
+
+            loss = optimize_model()
+            if loss is not None: losses.append(loss)
+            soft_update()
+
+            if step % LOG_EVERY == 0 or step == steps:
+                elapsed = time.perf_counter() - start
+                record = {
+                    "step": step,
+                    "transitions": step * num_envs,
+                    "episodes": len(scores),
+                    "mean_score": float(np.mean(scores)) if scores else None,
+                    "max_score": max(scores) if scores else None,
+                    "loss": torch.stack(losses).mean().item() if losses else None,
+                    "epsilon": eps_threshold,
+                    "transitions_per_s": step * num_envs / elapsed if elapsed else 0.0,
+                }
+                metrics.write(json.dumps(record) + "\n")
+                metrics.flush()
+
+                print(f"Step {step}/{steps}: {record['episodes']} episodes, mean score {record['mean_score']}, {record['transitions_per_s']:.0f} transitions/s")
+                scores = []
+                losses = []
+
+    envs.close()
+    print('Complete')
+
+# log2 and onehot observations are stored in their compact uint8 form
+obs_shape = env.observation_space.shape
+obs_dtype = np.float32 if OBS_MODE == "values" else env.observation_space.dtype
+
+policy_net = DQN(n_inputs=int(np.prod(obs_shape))).to(device)
+target_net = DQN(n_inputs=int(np.prod(obs_shape))).to(device)
 target_net.load_state_dict(policy_net.state_dict())
 
+# The network has no buffers, its parameters are its whole state
+policy_params = list(policy_net.parameters())
+target_params = list(target_net.parameters())
+
 optimizer = optim.AdamW(policy_net.parameters(), lr=LR, amsgrad=True)
-memory = ReplayMemory(1000)
+capacity = BATCHED_MEMORY_CAPACITY if args.batched else MEMORY_CAPACITY
+memory = PrioritizedReplayBuffer(capacity, obs_shape, obs_dtype, seed=args.seed) if PRIORITIZED else ReplayBuffer(capacity, obs_shape, obs_dtype, seed=args.seed)
+rng = np.random.default_rng(args.seed)
 
 steps_done = 0
 running = True
 
-train()
+if args.batched:
+    train_batched(args.num_envs, args.steps, args.metrics, args.seed)
+else:
+    train()
 
-while running:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
 
-    action = env.action_space.sample() 
-    obs, reward, done, _ = env.step(action)
-    env.render()
-    print('Reward:', reward)
-    print('Done:', done)
+        action = env.action_space.sample() 
+        obs, reward, done, _ = env.step(action)
+        env.render()
+        print('Reward:', reward)
+        print('Done:', done)
 
-    pygame.time.wait(200)
\ No newline at end of file
+        pygame.time.wait(200)
\ No newline at end of file
@@ -0,0 +1,139 @@
+import numpy as np
+from collections import namedtuple
+
+# Replay memories of the DQN, kept in preallocated NumPy arrays.
+#
+# Transitions are written in place into contiguous state / action / reward /
+# next state / done arrays used as a circular buffer, and a batch is drawn
+# with one vectorized index sampling and gathered with fancy indexing, so
+# the networks get ready-made arrays (torch.from_numpy does not copy them).
+
+# A sampled batch. indices identify the transitions for update_priorities,
+# weights are the importance-sampling weights of the prioritized memory
+# (None for the uniform one).
+Batch = namedtuple('Batch', ('states', 'actions', 'rewards', 'next_states', 'dones', 'indices', 'weights'))
+
+class ReplayBuffer:
+    def __init__(self, capacity, state_shape=(4, 4), state_dtype=np.float32, seed=None):
+        self.capacity = capacity
+        self.states = np.zeros((capacity, *state_shape), dtype=state_dtype)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity, *state_shape), dtype=state_dtype)
+        self.dones = np.zeros(capacity, dtype=np.bool_)
+
+        self.position = 0
+        self.size = 0
+        self.rng = np.random.default_rng(seed)
+
+    # Stores one transition, overwriting the oldest one when full
+    def push(self, state, action, reward, next_state, done):
+        self.push_batch(np.asarray(state)[None], [action], [reward], np.asarray(next_state)[None], [done])
+
+    # Stores a batch of transitions, e.g. one step of a vector environment
+    def push_batch(self, states, actions, rewards, next_states, dones):
+        indices = (self.position + np.arange(len(actions))) % self.capacity
+
+        self.states[indices] = states
+        self.actions[indices] = actions
+        self.rewards[indices] = rewards
+        self.next_states[indices] = next_states
+        self.dones[indices] = dones
+
+        self.position = (self.position + len(actions)) % self.capacity
+        self.size = min(self.size + len(actions), self.capacity)
+        return indices
+
+    def sample(self, batch_size):
+        return self._gather(self.rng.integers(0, self.size, size=batch_size), None)
+
+    def _gather(self, indices, weights):
+        return Batch(self.states[indices], self.actions[indices], self.rewards[indices], self.next_states[indices], self.dones[indices], indices, weights)
+
+    def __len__(self):
+        return self.size
+
+# Binary tree of sums over a power-of-two number of leaves, stored in one
+# array: node i has children 2i and 2i + 1, the leaves start at self.leaves
+# and node 1 holds the total. Updates and searches take a whole array of
+# indices or targets and walk the log2(capacity) levels with one vectorized
+# step per level.
+class SumTree:
+    def __init__(self, capacity):
+        self.leaves = 1
+        while self.leaves < capacity: self.leaves *= 2
+
+        self.depth = self.leaves.bit_length() - 1
+        self.nodes = np.zeros(2 * self.leaves, dtype=np.float64)
+
+    def total(self):
+        return self.nodes[1]
+
+    def get(self, indices):
+        return self.nodes[self.leaves + indices]
+
+    def update(self, indices, values):
+        nodes = self.nodes
+        positions = self.leaves + np.asarray(indices)
+        nodes[positions] = values
+
+        for _ in range(self.depth):
+            positions = np.unique(positions // 2)
+            nodes[positions] = nodes[2 * positions] + nodes[2 * positions + 1]
+
+    # Returns the leaf of every target, the first one whose prefix sum
+    # exceeds it
+    def find(self, targets):
+        nodes = self.nodes
+        targets = np.array(targets, dtype=np.float64)
+        positions = np.ones(len(targets), dtype=np.int64)
+
+        for _ in range(self.depth):
+            left = 2 * positions
+            right = targets >= nodes[left]
+            targets -= nodes[left] * right
+            positions = left + right
+
+        return positions - self.leaves
+
+# Prioritized experience replay (Schaul et al.): transitions are drawn with
+# probability priority^alpha, new transitions get the highest priority seen
+# so far, and the bias is corrected with the importance-sampling weights
+# (N * P(i))^-beta normalized by their maximum. The batch is drawn by
+# stratified sampling over the sum tree.
+class PrioritizedReplayBuffer(ReplayBuffer):
+    def __init__(self, capacity, state_shape=(4, 4), state_dtype=np.float32, seed=None, alpha=0.6, beta=0.4, eps=1e-6):
+        super().__init__(capacity, state_shape, state_dtype, seed)
+
+        self.alpha = alpha
+        self.beta = beta
+        self.eps = eps
+        self.tree = SumTree(capacity)
+        self.max_priority = 1.0
+
+    def push_batch(self, states, actions, rewards, next_states, dones):
+        indices = super().push_batch(states, actions, rewards, next_states, dones)
+        self.tree.update(indices, self.max_priority ** self.alpha)
+        return indices
+
+    def sample(self, batch_size, beta=None):
+        beta = self.beta if beta is None else beta
+        total = self.tree.total()
+
+        segment = total / batch_size
+        targets = (np.arange(batch_size) + self.rng.random(batch_size)) * segment
+        # Rounding in the tree sums can send a target past the last stored
+        # transition
+        indices = np.minimum(self.tree.find(targets), self.size - 1)
+
+        probs = self.tree.get(indices) / total
+        weights = (self.size * probs) ** -beta
+        weights /= weights.max()
+
+        return self._gather(indices, weights.astype(np.float32))
+
+    # Sets the priorities of sampled transitions, usually |TD error|
+    def update_priorities(self, indices, priorities):
+        priorities = np.abs(np.asarray(priorities, dtype=np.float64)) + self.eps
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.tree.update(indices, priorities ** self.alpha)